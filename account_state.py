@@ -0,0 +1,102 @@
+from collections import defaultdict
+from sqlalchemy import func
+from app import db
+from models import AccountState, BalanceCheckpoint, Block, Transaction
+from deployment_config import DeploymentConfig
+
+CHECKPOINT_INTERVAL = DeploymentConfig.BALANCE_CHECKPOINT_INTERVAL
+
+def _balance_deltas(transactions, sign=1):
+    """Net balance change per address for a list of transactions"""
+    deltas = defaultdict(int)
+    for tx in transactions:
+        deltas[tx.sender] -= sign * tx.amount
+        deltas[tx.recipient] += sign * tx.amount
+    return deltas
+
+def _apply_deltas(deltas, height):
+    if not deltas:
+        return
+    accounts = {
+        account.address: account
+        for account in AccountState.query.filter(AccountState.address.in_(list(deltas)))
+    }
+    for address, delta in deltas.items():
+        account = accounts.get(address)
+        if account is None:
+            account = AccountState(address=address, balance=0)
+            db.session.add(account)
+        account.balance += delta
+        account.updated_height = height
+
+def _write_checkpoint(height):
+    """Snapshot the accounts that changed since the previous checkpoint"""
+    db.session.flush()
+    changed = AccountState.query.filter(
+        AccountState.updated_height > height - CHECKPOINT_INTERVAL
+    )
+    db.session.add_all(
+        BalanceCheckpoint(height=height, address=account.address, balance=account.balance)
+        for account in changed
+    )
+
+def apply_block(block):
+    """Add a block's transactions to account balances.
+
+    Only stages the changes, the caller commits them together with the block.
+    """
+    _apply_deltas(_balance_deltas(block.transactions), block.height)
+    if block.height % CHECKPOINT_INTERVAL == 0:
+        _write_checkpoint(block.height)
+
+def revert_block(block):
+    """Undo apply_block for a block being removed from the chain"""
+    BalanceCheckpoint.query.filter_by(height=block.height).delete()
+    _apply_deltas(_balance_deltas(block.transactions, sign=-1), block.height - 1)
+
+def reset_state():
+    """Drop all balances, used before the chain is rebuilt from scratch"""
+    BalanceCheckpoint.query.delete()
+    AccountState.query.delete()
+
+def rebuild_state():
+    """Recompute every balance from the stored chain, e.g. for a database
+    that predates the account_state table"""
+    reset_state()
+    for block in Block.query.order_by(Block.height):
+        apply_block(block)
+    db.session.commit()
+
+def get_balance(address):
+    """Confirmed balance of an address in base units"""
+    account = db.session.get(AccountState, address)
+    return account.balance if account else 0
+
+def _sum_amounts(column, address, from_height, to_height):
+    """Sum of amounts in blocks from_height < height <= to_height where column == address"""
+    total = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).join(
+        Block, Transaction.block_id == Block.id
+    ).filter(
+        column == address,
+        Block.height > from_height,
+        Block.height <= to_height
+    ).scalar()
+    return int(total)  # PostgreSQL sums bigint columns as numeric
+
+def get_balance_at(address, height):
+    """Balance of an address in base units as of a block height.
+
+    Starts from the nearest checkpoint at or below height and replays at
+    most CHECKPOINT_INTERVAL blocks of transactions on top of it. Returns
+    the balance and the checkpoint height it was derived from.
+    """
+    checkpoint_height = height - height % CHECKPOINT_INTERVAL
+    checkpoint = BalanceCheckpoint.query.filter(
+        BalanceCheckpoint.address == address,
+        BalanceCheckpoint.height <= checkpoint_height
+    ).order_by(BalanceCheckpoint.height.desc()).first()
+
+    balance = checkpoint.balance if checkpoint else 0
+    balance += _sum_amounts(Transaction.recipient, address, checkpoint_height, height)
+    balance -= _sum_amounts(Transaction.sender, address, checkpoint_height, height)
+    return balance, checkpoint_height
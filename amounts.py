@@ -0,0 +1,33 @@
+from decimal import Decimal, InvalidOperation
+
+# Amounts are stored and hashed as integer base units, 10^-8 of a coin.
+# The API and templates deal in coins, converting at the edge.
+
+COIN_DECIMALS = 8
+BASE_UNITS_PER_COIN = 10 ** COIN_DECIMALS
+MAX_BASE_UNITS = 2 ** 63 - 1  # BigInteger column and int64 encoding
+
+def to_base_units(value):
+    """Convert a coin amount (number or numeric string) to integer base units.
+
+    Raises ValueError for amounts that are not finite, are too large, or
+    have more than COIN_DECIMALS decimal places.
+    """
+    try:
+        # str() keeps floats at their shortest repr, e.g. 0.1 rather than 0.1000000000000000055
+        coins = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value}")
+    if not coins.is_finite():
+        raise ValueError(f"Invalid amount: {value}")
+
+    units = coins * BASE_UNITS_PER_COIN
+    if units != units.to_integral_value():
+        raise ValueError(f"Amount has more than {COIN_DECIMALS} decimal places: {value}")
+    if abs(units) > MAX_BASE_UNITS:
+        raise ValueError(f"Amount too large: {value}")
+    return int(units)
+
+def to_coins(units):
+    """Convert integer base units to a coin amount for display and signing data"""
+    return int(units) / BASE_UNITS_PER_COIN
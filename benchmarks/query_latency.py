@@ -0,0 +1,191 @@
+"""Seed a large chain and measure the latency of hot lookup queries.
+
+Run from the repository root against a throwaway database, the script
+drops and recreates every table in DATABASE_URL:
+
+    DATABASE_URL=postgresql://... python -m benchmarks.query_latency --reset
+
+Pass --without-indexes to drop the secondary indexes before measuring, so
+the same seeded data can be compared before and after:
+
+    python -m benchmarks.query_latency --reset --without-indexes
+    python -m benchmarks.query_latency
+
+Use --explain to print the PostgreSQL plan of each query.
+"""
+import argparse
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, text
+from app import app, db
+from models import Block, Transaction, Node, AccountState
+from account_state import get_balance, get_balance_at
+from reset_db import create_indexes
+
+def _hash():
+    return uuid.uuid4().hex + uuid.uuid4().hex
+
+def _secondary_indexes():
+    """Model indexes that are not backing a primary key or unique constraint"""
+    return [
+        index
+        for table in db.metadata.sorted_tables
+        for index in table.indexes
+        if not index.unique
+    ]
+
+def seed(blocks, transactions_per_block, addresses, nodes):
+    """Insert a synthetic chain with bulk inserts, skipping proof of work"""
+    db.drop_all()
+    db.create_all()
+
+    addresses = [f"0x{uuid.uuid4().hex[:40]}" for _ in range(addresses)]
+    start = datetime.utcnow() - timedelta(minutes=blocks)
+    previous_hash = "0" * 64
+    block_rows = []
+    for height in range(blocks):
+        block_hash = _hash()
+        block_rows.append({
+            'id': height + 1,
+            'height': height,
+            'timestamp': start + timedelta(minutes=height),
+            'previous_hash': previous_hash,
+            'hash': block_hash,
+            'nonce': 0,
+            'bits': 0x1f010000,
+            'merkle_root': "0" * 64,
+            'validation_status': random.choice(['pending', 'validated', 'invalid'])
+        })
+        previous_hash = block_hash
+    db.session.execute(insert(Block), block_rows)
+
+    balances = {}
+    batch = []
+    for block in block_rows:
+        for _ in range(transactions_per_block):
+            sender, recipient = random.sample(addresses, 2)
+            amount = random.randint(1, 1000) * 10 ** 6  # 0.01 to 10 coins in base units
+            balances[sender] = balances.get(sender, 0) - amount
+            balances[recipient] = balances.get(recipient, 0) + amount
+            batch.append({
+                'hash': _hash(),
+                'sender': sender,
+                'recipient': recipient,
+                'amount': amount,
+                'timestamp': block['timestamp'],
+                'block_id': block['id']
+            })
+        if len(batch) >= 10000:
+            db.session.execute(insert(Transaction), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(Transaction), batch)
+
+    db.session.execute(insert(AccountState), [
+        {'address': address, 'balance': balance, 'updated_height': blocks - 1}
+        for address, balance in balances.items()
+    ])
+    db.session.execute(insert(Node), [
+        {'address': f"node-{i}:5000", 'last_seen': datetime.utcnow() - timedelta(minutes=random.randint(0, 120))}
+        for i in range(nodes)
+    ])
+    db.session.commit()
+    return addresses
+
+def hot_queries(address, tip_height):
+    """The lookups behind balances, explorer lists, PBFT, node pruning and monitoring"""
+    stale = datetime.utcnow() - timedelta(minutes=30)
+    some_hash = Block.query.filter_by(height=tip_height // 2).first().hash
+    some_tx_hash = db.session.query(Transaction.hash).filter_by(block_id=tip_height // 2).first()[0]
+    return {
+        'balance (account_state)': lambda: get_balance(address),
+        'balance at height': lambda: get_balance_at(address, tip_height - 1),
+        'address history': lambda: Transaction.query.filter(
+            (Transaction.sender == address) | (Transaction.recipient == address)
+        ).order_by(Transaction.timestamp.desc()).limit(20).all(),
+        'transaction by hash': lambda: Transaction.query.filter_by(hash=some_tx_hash).first(),
+        'block transactions': lambda: Transaction.query.filter_by(block_id=tip_height // 2).all(),
+        'explorer recent transactions': lambda: Transaction.query.order_by(
+            Transaction.timestamp.desc()
+        ).limit(5).all(),
+        'explorer volume': lambda: db.session.query(
+            func.count(Transaction.id), func.sum(Transaction.amount)
+        ).filter(Transaction.block_id.isnot(None)).one(),
+        'explorer status counts': lambda: Block.query.filter_by(validation_status='pending').count(),
+        'pbft previous block': lambda: Block.query.filter_by(hash=some_hash).first(),
+        'child block': lambda: Block.query.filter_by(previous_hash=some_hash).first(),
+        'monitor last block': lambda: Block.query.order_by(Block.timestamp.desc()).first(),
+        'stale nodes': lambda: Node.query.filter(Node.last_seen < stale).all(),
+        'active node count': lambda: Node.query.filter(Node.last_seen >= stale).count()
+    }
+
+def measure(queries, repeat):
+    results = {}
+    for name, query in queries.items():
+        query()  # warm up caches
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(timings), max(timings))
+    return results
+
+def explain(address):
+    """Print PostgreSQL plans for the per-address lookups"""
+    statements = {
+        'address history': (
+            "SELECT * FROM transaction WHERE sender = :a OR recipient = :a "
+            "ORDER BY timestamp DESC LIMIT 20"
+        ),
+        'monitor last block': "SELECT * FROM block ORDER BY timestamp DESC LIMIT 1"
+    }
+    for name, statement in statements.items():
+        print(f"\n{name}:")
+        for row in db.session.execute(text("EXPLAIN ANALYZE " + statement), {'a': address}):
+            print("  " + row[0])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reset', action='store_true', help='drop all tables and seed a new chain')
+    parser.add_argument('--blocks', type=int, default=20000)
+    parser.add_argument('--transactions-per-block', type=int, default=50)
+    parser.add_argument('--addresses', type=int, default=5000)
+    parser.add_argument('--nodes', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--without-indexes', action='store_true', help='drop secondary indexes before measuring')
+    parser.add_argument('--explain', action='store_true', help='print PostgreSQL query plans')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.reset:
+            start = time.perf_counter()
+            seed(args.blocks, args.transactions_per_block, args.addresses, args.nodes)
+            print(f"Seeded {args.blocks} blocks in {time.perf_counter() - start:.1f}s")
+
+        if args.without_indexes:
+            for index in _secondary_indexes():
+                index.drop(bind=db.engine, checkfirst=True)
+        else:
+            create_indexes()
+        db.session.execute(text("ANALYZE") if db.engine.dialect.name == 'postgresql' else text("SELECT 1"))
+        db.session.commit()
+
+        address = db.session.query(Transaction.sender).first()[0]
+        tip_height = db.session.query(func.max(Block.height)).scalar()
+        results = measure(hot_queries(address, tip_height), args.repeat)
+
+        label = 'without secondary indexes' if args.without_indexes else 'with indexes'
+        print(f"\nQuery latency {label} ({tip_height + 1} blocks)")
+        print(f"{'query':<32}{'median ms':>12}{'max ms':>12}")
+        for name, (median, worst) in results.items():
+            print(f"{name:<32}{median:>12.2f}{worst:>12.2f}")
+
+        if args.explain and db.engine.dialect.name == 'postgresql':
+            explain(address)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Compare signing and verification throughput of the signature backends.
+
+Run from the repository root:
+
+    python -m benchmarks.signature_backends [--count N]
+
+Every available backend signs and verifies the same transactions, and each
+backend's signatures are checked by every other backend to confirm the
+wire format is identical.
+"""
+import argparse
+import hashlib
+import json
+import time
+from ecdsa import SigningKey, SECP256k1
+from crypto_backend import BACKENDS, get_backend
+
+def _message_hashes(count):
+    return [
+        hashlib.sha256(json.dumps({
+            'sender': '0x' + '11' * 20,
+            'recipient': '0x' + '22' * 20,
+            'amount': i,
+            'timestamp': '2024-01-01T00:00:00'
+        }, sort_keys=True).encode()).digest()
+        for i in range(count)
+    ]
+
+def _available_backends():
+    backends = []
+    for name in BACKENDS:
+        try:
+            backends.append(get_backend(name))
+        except ValueError as e:
+            print(f"Skipping {name}: {e}")
+    return backends
+
+def run(count):
+    private_key = SigningKey.generate(curve=SECP256k1)
+    key_bytes = private_key.get_verifying_key().to_string()
+    message_hashes = _message_hashes(count)
+    backends = _available_backends()
+
+    signatures = {}
+    print(f"{'backend':<12}{'sign/s':>12}{'verify/s':>12}")
+    for backend in backends:
+        start = time.perf_counter()
+        signed = [backend.sign(private_key, h) for h in message_hashes]
+        sign_rate = count / (time.perf_counter() - start)
+
+        public_key = backend.load_public_key(key_bytes, precompute=True)
+        start = time.perf_counter()
+        results = [backend.verify(public_key, sig, h) for sig, h in zip(signed, message_hashes)]
+        verify_rate = count / (time.perf_counter() - start)
+
+        if not all(results):
+            raise SystemExit(f"{backend.name} failed to verify its own signatures")
+        signatures[backend.name] = signed
+        print(f"{backend.name:<12}{sign_rate:>12.0f}{verify_rate:>12.0f}")
+
+    # Signatures must be interchangeable between backends
+    for signer, signed in signatures.items():
+        for backend in backends:
+            public_key = backend.load_public_key(key_bytes)
+            if not all(backend.verify(public_key, sig, h) for sig, h in zip(signed, message_hashes)):
+                raise SystemExit(f"{backend.name} rejected signatures made by {signer}")
+    print("All backends accept each other's signatures")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=500, help='signatures per backend')
+    run(parser.parse_args().count)
@@ -0,0 +1,201 @@
+import bisect
+import logging
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, wait
+from deployment_config import DeploymentConfig
+
+logger = logging.getLogger(__name__)
+
+class DownloadError(Exception):
+    """A block range could not be downloaded from any peer"""
+
+class PeerScore:
+    """Download record of one peer, the fastest idle peer gets the next chunk"""
+
+    def __init__(self):
+        self.throughput = None  # blocks per second, exponentially smoothed
+        self.failures = 0  # consecutive failed, slow or invalid responses
+
+    def record_success(self, blocks, elapsed):
+        rate = blocks / max(elapsed, 0.001)
+        self.throughput = rate if self.throughput is None else 0.7 * self.throughput + 0.3 * rate
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.throughput is not None:
+            self.throughput /= 2
+
+    @property
+    def rank(self):
+        # Peers without a measurement go first so that they get one
+        return float('inf') if self.throughput is None else self.throughput
+
+# Kept across syncs so later downloads start with the fast peers
+peer_scores = defaultdict(PeerScore)
+
+def _timed_fetch(fetch, address, path):
+    started = time.monotonic()
+    data = fetch(address, path)
+    return data, time.monotonic() - started
+
+class _Request:
+    def __init__(self, start, address, future):
+        self.start = start
+        self.address = address
+        self.future = future
+        self.sent_at = time.monotonic()
+        self.hedged = False
+
+class BlockDownloader:
+    """Download a range of blocks from several peers at once.
+
+    The range is split into chunks of MAX_BLOCKS_PER_REQUEST blocks. Each
+    chunk is requested from the idle peer with the best throughput whose
+    tip covers it, and at most PEER_FETCH_WORKERS chunks are fetched or
+    buffered ahead of the one being validated. Chunks that fail, come back
+    invalid or are slower than PEER_TIMEOUT are requested again from
+    another peer. Iterating yields the validated blocks in height order.
+    """
+
+    requests_per_peer = 2
+    max_failures = 3  # consecutive failures before a peer is left out of this download
+
+    def __init__(self, peers, from_height, to_height, fetch, executor, validate,
+                 invalid_errors=(KeyError, TypeError, ValueError)):
+        """peers maps each address to its tip height.
+
+        fetch(address, path) returns a parsed response and runs on executor.
+        validate(start, blocks data) returns the checked blocks of a chunk,
+        raising one of invalid_errors if it is invalid.
+        """
+        self.peers = dict(peers)
+        self.to_height = to_height
+        self.fetch = fetch
+        self.executor = executor
+        self.validate = validate
+        self.invalid_errors = invalid_errors
+        self.chunk_size = DeploymentConfig.MAX_BLOCKS_PER_REQUEST
+        self.chunks = list(range(from_height, to_height + 1, self.chunk_size))
+        self.max_ahead = DeploymentConfig.PEER_FETCH_WORKERS
+        self.attempts = defaultdict(int)
+
+    def _chunk_end(self, start):
+        return min(start + self.chunk_size - 1, self.to_height)
+
+    def __iter__(self):
+        pending = list(self.chunks)  # chunk starts still to be requested, sorted
+        requests = []
+        received = {}  # chunk start: (address, blocks data)
+        next_index = 0
+        try:
+            while next_index < len(self.chunks):
+                start = self.chunks[next_index]
+                if start in received:
+                    address, blocks_data = received.pop(start)
+                    try:
+                        blocks = self.validate(start, blocks_data)
+                    except self.invalid_errors as e:
+                        # Most likely the peer is on another branch, leave it out
+                        # without counting against the chunk as it cannot happen again
+                        self.peers.pop(address, None)
+                        self._retry(start, address, e, pending, requests, received, start, count_attempt=False)
+                        continue
+                    next_index += 1
+                    yield from blocks
+                    continue
+
+                self._hedge(start, requests, pending)
+                self._dispatch(pending, requests, next_index)
+                if not requests:
+                    raise DownloadError(f'No peer left to download blocks from height {start}')
+                done, _ = wait(
+                    [request.future for request in requests],
+                    timeout=DeploymentConfig.PEER_TIMEOUT,
+                    return_when=FIRST_COMPLETED
+                )
+                for request in [request for request in requests if request.future in done]:
+                    requests.remove(request)
+                    self._collect(request, pending, requests, received, start)
+        finally:
+            for request in requests:
+                request.future.cancel()
+
+    def _pick_peer(self, start, requests):
+        """Fastest peer that has the chunk, is not already fetching it and has a free slot"""
+        busy = defaultdict(int)
+        for request in requests:
+            busy[request.address] += 1
+        fetching = {request.address for request in requests if request.start == start}
+        candidates = [
+            address for address, tip_height in self.peers.items()
+            if tip_height >= self._chunk_end(start)
+            and busy[address] < self.requests_per_peer
+            and address not in fetching
+        ]
+        return max(candidates, key=lambda address: (peer_scores[address].rank, -busy[address]), default=None)
+
+    def _dispatch(self, pending, requests, next_index):
+        """Request pending chunks within the lookahead window, lowest first"""
+        last_start = self.chunks[min(next_index + self.max_ahead, len(self.chunks) - 1)]
+        while pending and pending[0] <= last_start:
+            start = pending[0]
+            address = self._pick_peer(start, requests)
+            if address is None:
+                break
+            pending.pop(0)
+            count = self._chunk_end(start) - start + 1
+            future = self.executor.submit(
+                _timed_fetch, self.fetch, address, f'/blocks?from_height={start}&count={count}'
+            )
+            requests.append(_Request(start, address, future))
+
+    def _hedge(self, start, requests, pending):
+        """Ask another peer for the chunk being waited on if its peer is too slow"""
+        waiting = [request for request in requests if request.start == start]
+        if not waiting or start in pending:
+            return
+        if all(time.monotonic() - request.sent_at > DeploymentConfig.PEER_TIMEOUT for request in waiting):
+            for request in waiting:
+                if not request.hedged:
+                    request.hedged = True
+                    peer_scores[request.address].record_failure()
+            logger.warning(f"Blocks from height {start} are late, requesting them from another peer")
+            bisect.insort(pending, start)
+
+    def _collect(self, request, pending, requests, received, next_start):
+        if request.future.exception():
+            self._retry(request.start, request.address, request.future.exception(),
+                        pending, requests, received, next_start)
+            return
+        data, elapsed = request.future.result()
+        blocks_data = data.get('blocks') if isinstance(data, dict) else None
+        if not isinstance(blocks_data, list) or len(blocks_data) != self._chunk_end(request.start) - request.start + 1:
+            self._retry(request.start, request.address, 'incomplete response',
+                        pending, requests, received, next_start)
+            return
+
+        peer_scores[request.address].record_success(len(blocks_data), elapsed)
+        # A hedged chunk may arrive twice, the first copy wins
+        if request.start >= next_start and request.start not in received:
+            received[request.start] = (request.address, blocks_data)
+            if request.start in pending:
+                pending.remove(request.start)
+
+    def _retry(self, start, address, reason, pending, requests, received, next_start, count_attempt=True):
+        """Score a failed response and queue its chunk again unless another copy is on the way"""
+        logger.warning(f"Could not download blocks from height {start} from {address}: {reason}")
+        score = peer_scores[address]
+        score.record_failure()
+        if score.failures >= self.max_failures:
+            self.peers.pop(address, None)
+
+        if (start < next_start or start in received or start in pending
+                or any(request.start == start for request in requests)):
+            return
+        if count_attempt:
+            self.attempts[start] += 1
+        if self.attempts[start] > DeploymentConfig.BLOCK_DOWNLOAD_RETRIES:
+            raise DownloadError(f'Blocks from height {start} failed {self.attempts[start]} times')
+        bisect.insort(pending, start)
@@ -0,0 +1,211 @@
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from app import app, db
+from models import Block, Transaction
+from blockchain import Blockchain
+from mempool import mempool
+from gossip import gossip
+from wallet import Wallet
+from deployment_config import DeploymentConfig
+
+logger = logging.getLogger(__name__)
+
+class MiningJob:
+    """A single attempt to mine the pending transactions on top of a chain tip"""
+
+    QUEUED = 'queued'
+    MINING = 'mining'
+    COMPLETED = 'completed'
+    ABORTED = 'aborted'
+    FAILED = 'failed'
+
+    def __init__(self, job_id, previous_hash, transaction_hashes):
+        self.id = job_id
+        self.previous_hash = previous_hash
+        self.transaction_hashes = transaction_hashes
+        self.status = self.QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.block_hash = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'previous_hash': self.previous_hash,
+            'transaction_count': len(self.transaction_hashes),
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'block_hash': self.block_hash,
+            'error': self.error
+        }
+
+class BlockProducer:
+    """Mines pending transactions into blocks on a background thread"""
+
+    def __init__(self, poll_interval=None, max_transactions=None, history_size=50):
+        self.poll_interval = poll_interval or DeploymentConfig.MINING_POLL_INTERVAL
+        self.max_transactions = max_transactions or DeploymentConfig.MAX_BLOCK_TRANSACTIONS
+        self.history_size = history_size
+        self.blockchain = None
+        self.current_job = None
+        self.jobs = OrderedDict()  # recent jobs by id, oldest first
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the producer thread if it is not already running"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name='block-producer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the producer thread, aborting any job in progress"""
+        self._stopped.set()
+        self.abort('Block producer stopped')
+        self._wakeup.set()
+
+    def is_running(self):
+        return bool(self._thread and self._thread.is_alive())
+
+    def trigger(self):
+        """Wake the producer to look for pending transactions immediately"""
+        self._wakeup.set()
+
+    def abort(self, reason):
+        """Abort the job in progress, returns True if a job was cancelled"""
+        with self._lock:
+            job = self.current_job
+            if not job:
+                return False
+            job.error = reason
+            job.cancel_event.set()
+        return True
+
+    def notify_new_tip(self):
+        """Restart mining on the new tip after the chain changed underneath us"""
+        if self.abort('Chain tip changed, job restarted'):
+            logger.info('New chain tip received, restarting mining job')
+        self._wakeup.set()
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def get_status(self):
+        """Get producer state and recent jobs"""
+        with self._lock:
+            current = self.current_job.to_dict() if self.current_job else None
+            recent = [job.to_dict() for job in reversed(self.jobs.values())]
+        return {
+            'running': self.is_running(),
+            'poll_interval': self.poll_interval,
+            'max_transactions': self.max_transactions,
+            'current_job': current,
+            'recent_jobs': recent
+        }
+
+    def _run(self):
+        with app.app_context():
+            self.blockchain = Blockchain()
+
+        while not self._stopped.is_set():
+            try:
+                with app.app_context():
+                    mined = self._produce_block()
+            except Exception as e:
+                logger.error(f"Block producer error: {str(e)}")
+                mined = False
+
+            # Keep going while there is work, otherwise wait for new transactions
+            if not mined:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _produce_block(self):
+        """Run one mining job, returns True if the caller should immediately try again"""
+        pending = mempool.select(self.max_transactions)
+        if not pending:
+            return False
+
+        job = self._start_job(pending)
+        try:
+            block = self.blockchain.create_block(pending, cancel_event=job.cancel_event)
+        except Exception as e:
+            db.session.rollback()
+            self._finish_job(job, MiningJob.FAILED, error=str(e))
+            logger.error(f"Mining job {job.id} failed: {str(e)}")
+            if not self._drop_invalid(pending):
+                # Nothing to blame, wait out the poll interval rather than
+                # retrying the same transactions on every new arrival
+                self._stopped.wait(self.poll_interval)
+            return False
+
+        if block is None:
+            db.session.rollback()
+            self._finish_job(job, MiningJob.ABORTED)
+            return not self._stopped.is_set()
+
+        mempool.remove(job.transaction_hashes)
+        gossip.announce_block(block)
+        self._finish_job(job, MiningJob.COMPLETED, block_hash=block.hash)
+        logger.info(f"Mining job {job.id} produced block {block.hash} with {len(pending)} transactions")
+        return True
+
+    def _drop_invalid(self, transactions):
+        """Remove transactions that fail verification or are already stored
+        so they don't block every job, returns how many were removed"""
+        results = Wallet.verify_batch(
+            (tx.public_key, tx.signature, tx.get_signing_data()) for tx in transactions
+        )
+        invalid = {tx.hash for tx, is_valid in zip(transactions, results) if not is_valid}
+        # Inserting them again would violate the unique transaction hash
+        invalid.update(
+            tx_hash for (tx_hash,) in
+            db.session.query(Transaction.hash).filter(Transaction.hash.in_([tx.hash for tx in transactions]))
+        )
+        if invalid:
+            logger.warning(f"Dropping {len(invalid)} transactions that cannot be mined")
+            mempool.remove(invalid)
+        return len(invalid)
+
+    def _start_job(self, transactions):
+        tip = Block.query.order_by(Block.height.desc()).first()
+        job = MiningJob(
+            next(self._job_ids),
+            tip.hash if tip else None,
+            [tx.hash for tx in transactions]
+        )
+        job.status = MiningJob.MINING
+        job.started_at = datetime.utcnow()
+        with self._lock:
+            self.current_job = job
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+        return job
+
+    def _finish_job(self, job, status, block_hash=None, error=None):
+        with self._lock:
+            job.status = status
+            job.finished_at = datetime.utcnow()
+            job.block_hash = block_hash
+            if error:
+                job.error = error
+            if self.current_job is job:
+                self.current_job = None
+
+block_producer = BlockProducer()
@@ -1,13 +1,31 @@
-import hashlib
+import threading
 from datetime import datetime
 from app import db
-from models import Block, Transaction
+from models import Block, ValidationCheckpoint
 from proof_of_work import ProofOfWork
+from account_state import apply_block
 from wallet import Wallet
+from chain_validator import ChainValidator, ChainValidationError
+from deployment_config import DeploymentConfig
+
+# Fixed so that every node creates the same genesis block
+GENESIS_TIMESTAMP = datetime(2024, 1, 1)
+
+VALIDATION_CHECKPOINT_ID = 1
+
+# Held while blocks are inserted or rolled back, so a sync and a newly
+# mined block never change the chain at the same time
+chain_lock = threading.RLock()
 
 class Blockchain:
     def __init__(self):
-        self.pow = ProofOfWork()
+        self.pow = ProofOfWork(
+            difficulty=DeploymentConfig.INITIAL_DIFFICULTY,
+            workers=DeploymentConfig.MINING_WORKERS
+        )
+        self.block_interval = DeploymentConfig.TARGET_BLOCK_INTERVAL
+        self.retarget_interval = DeploymentConfig.RETARGET_INTERVAL
+        self.last_validation_error = None
         self._initialize_chain()
 
     def _initialize_chain(self):
@@ -16,56 +34,144 @@ class Blockchain:
 
     def _create_genesis_block(self):
         genesis_block = Block(
+            height=0,
+            timestamp=GENESIS_TIMESTAMP,
             previous_hash="0"*64,
-            hash=self._calculate_hash("0"*64, [], 0),
-            nonce=0
+            nonce=0,
+            bits=self.pow.initial_bits
         )
+        genesis_block.merkle_root = genesis_block.compute_merkle_root([])
+        genesis_block.hash = genesis_block.calculate_hash()
         db.session.add(genesis_block)
         db.session.commit()
 
-    def _calculate_hash(self, previous_hash, transactions, nonce):
-        block_string = f"{previous_hash}{transactions}{nonce}".encode()
-        return hashlib.sha256(block_string).hexdigest()
+    def _next_bits(self, previous_block, window_start):
+        """Get the target for the block after previous_block.
+
+        The target only changes on heights that are a multiple of the
+        retarget interval, based on how long the window starting at
+        window_start took to mine compared to the configured block interval.
+        Windows start at height 1 at the earliest, since the genesis
+        timestamp is fixed rather than the time the chain started.
+        """
+        height = previous_block.height + 1
+        if height % self.retarget_interval != 0 or window_start is None:
+            return previous_block.bits
+        if window_start.height >= previous_block.height:
+            return previous_block.bits
+
+        actual_timespan = (previous_block.timestamp - window_start.timestamp).total_seconds()
+        expected_timespan = (previous_block.height - window_start.height) * self.block_interval
+        return self.pow.retarget(previous_block.bits, actual_timespan, expected_timespan)
+
+    def get_next_bits(self, previous_block):
+        """Get the target for the next block from the stored timestamp history"""
+        window_start = Block.query.filter_by(
+            height=max(previous_block.height + 1 - self.retarget_interval, 1)
+        ).first()
+        return self._next_bits(previous_block, window_start)
 
     def _verify_transactions(self, transactions):
         """Verify all transactions in a block"""
-        for tx in transactions:
-            if not Wallet.verify_signature(
-                tx.public_key,
-                tx.signature,
-                tx.get_signing_data()
-            ):
-                return False
-        return True
+        return all(Wallet.verify_batch(
+            (tx.public_key, tx.signature, tx.get_signing_data()) for tx in transactions
+        ))
 
-    def create_block(self, transactions):
+    def create_block(self, transactions, cancel_event=None):
+        """Mine and store a block, returns None if mining was cancelled or the tip changed"""
         # Verify all transactions first
         if not self._verify_transactions(transactions):
             raise ValueError("Invalid transaction signatures detected")
 
-        previous_block = Block.query.order_by(Block.id.desc()).first()
-        nonce = self.pow.find_nonce(previous_block.hash, transactions)
-        
+        previous_block = Block.query.order_by(Block.height.desc()).first()
         new_block = Block(
+            height=previous_block.height + 1,
+            timestamp=datetime.utcnow(),
             previous_hash=previous_block.hash,
-            hash=self._calculate_hash(previous_block.hash, transactions, nonce),
-            nonce=nonce
+            bits=self.get_next_bits(previous_block)
         )
-        
-        for tx in transactions:
-            new_block.transactions.append(tx)
+        new_block.merkle_root = new_block.compute_merkle_root(transactions)
 
-        db.session.add(new_block)
-        db.session.commit()
+        # The header commits to the transactions, so mining only hashes a fixed-size header
+        nonce = self.pow.find_nonce(new_block.header_prefix(), new_block.bits, cancel_event)
+        if nonce is None:
+            return None
+
+        new_block.nonce = nonce
+        new_block.hash = new_block.calculate_hash()
+
+        with chain_lock:
+            # A sync may have replaced the tip while we were mining
+            tip_hash = db.session.query(Block.hash).order_by(Block.height.desc()).limit(1).scalar()
+            if tip_hash != previous_block.hash:
+                return None
+
+            for tx in transactions:
+                new_block.transactions.append(tx)
+
+            db.session.add(new_block)
+            # Balances are updated in the same database transaction as the block
+            apply_block(new_block)
+            db.session.commit()
         return new_block
 
-    def is_valid_chain(self):
-        blocks = Block.query.order_by(Block.id).all()
-        for i in range(1, len(blocks)):
-            if blocks[i].previous_hash != blocks[i-1].hash:
-                return False
-            if not self.pow.is_valid_proof(blocks[i].nonce, blocks[i].previous_hash, blocks[i].transactions):
-                return False
-            if not self._verify_transactions(blocks[i].transactions):
-                return False
+    def get_validated_tip(self):
+        """Checkpoint of the highest validated block, or None if it no longer
+        matches the stored chain, e.g. after a reorg"""
+        checkpoint = db.session.get(ValidationCheckpoint, VALIDATION_CHECKPOINT_ID)
+        if checkpoint is None:
+            return None
+        block = Block.query.filter_by(height=checkpoint.height).first()
+        if block is None or block.hash != checkpoint.hash:
+            return None
+        return checkpoint
+
+    def reset_validated_tip(self):
+        """Forget the checkpoint so the next validation starts from genesis"""
+        ValidationCheckpoint.query.delete()
+
+    def rewind_validated_tip(self, height):
+        """Move the checkpoint down to height when blocks above it are rolled back"""
+        checkpoint = db.session.get(ValidationCheckpoint, VALIDATION_CHECKPOINT_ID)
+        if checkpoint is None or checkpoint.height <= height:
+            return
+        block = Block.query.filter_by(height=height).first()
+        checkpoint.height = block.height
+        checkpoint.hash = block.hash
+
+    def _set_validated_tip(self, block):
+        """Record block, a Block or HeaderInfo, as the highest validated block"""
+        checkpoint = db.session.get(ValidationCheckpoint, VALIDATION_CHECKPOINT_ID)
+        if checkpoint is None:
+            checkpoint = ValidationCheckpoint(id=VALIDATION_CHECKPOINT_ID)
+            db.session.add(checkpoint)
+        checkpoint.height = block.height
+        checkpoint.hash = block.hash
+        db.session.commit()
+
+    def is_valid_chain(self, *, full=False):
+        """Validate the stored chain.
+
+        Only blocks above the validated tip checkpoint are checked, pass
+        full=True to re-verify everything from genesis. The checkpoint
+        moves to the chain tip when validation succeeds. Otherwise it moves
+        below the failing block and the failure is kept in
+        last_validation_error.
+        """
+        checkpoint = None if full else self.get_validated_tip()
+        try:
+            tip = ChainValidator(self).validate(checkpoint.height if checkpoint else 0)
+        except ChainValidationError as e:
+            self.last_validation_error = e
+            # Blocks from the failing one up are no longer known to be valid
+            if e.height > 0:
+                self.rewind_validated_tip(e.height - 1)
+            else:
+                self.reset_validated_tip()
+            db.session.commit()
+            return False
+
+        self.last_validation_error = None
+        if not checkpoint or tip.height > checkpoint.height:
+            self._set_validated_tip(tip)
         return True
@@ -0,0 +1,210 @@
+from collections import deque, namedtuple
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from sqlalchemy.orm import selectinload
+from models import Block
+from merkle import merkle_root
+from proof_of_work import ProofOfWork
+from serialization import header_hash
+from wallet import Wallet, signature_cache, _get_verify_pool, _reset_verify_pool
+from deployment_config import DeploymentConfig
+
+# What the retarget rule and linkage checks need from earlier blocks
+HeaderInfo = namedtuple('HeaderInfo', ['height', 'hash', 'timestamp', 'bits'])
+
+class ChainValidationError(Exception):
+    """First problem found in the chain and the height of the block it is in"""
+
+    def __init__(self, code, message, height):
+        super().__init__(f"Block {height}: {message}")
+        self.code = code
+        self.message = message
+        self.height = height
+
+    def to_dict(self):
+        return {
+            'code': self.code,
+            'message': self.message,
+            'height': self.height
+        }
+
+def check_linkage(block, recent, blockchain):
+    """Check a block or header against the ones before it.
+
+    recent holds the HeaderInfo of at least the previous block, and of the
+    retarget window before it when available. Returns a ChainValidationError
+    or None.
+    """
+    previous = recent[-1]
+    if block.height != previous.height + 1:
+        return ChainValidationError('INVALID_HEIGHT', f'Expected block {previous.height + 1}', block.height)
+    if block.previous_hash != previous.hash:
+        return ChainValidationError('INVALID_PREV_HASH', 'Previous block hash mismatch', block.height)
+
+    # Each block must use the target that was in force at its height
+    window_height = max(block.height - blockchain.retarget_interval, 1)
+    window_start = None
+    if recent[0].height <= window_height <= previous.height:
+        window_start = recent[window_height - recent[0].height]
+    if block.bits != blockchain._next_bits(previous, window_start):
+        return ChainValidationError('INVALID_BITS', 'Block target does not follow the retarget rule', block.height)
+    return None
+
+def check_merkle_root(block):
+    """Check the block's transaction hashes and merkle root, returns a ChainValidationError or None"""
+    tx_hashes = []
+    for tx in block.transactions:
+        tx_hash = tx.calculate_hash()
+        if tx.hash != tx_hash.hex():
+            return ChainValidationError('INVALID_TRANSACTION_HASH', f'Transaction hash mismatch for {tx.hash}', block.height)
+        tx_hashes.append(tx_hash)
+    if block.merkle_root != merkle_root(tx_hashes).hex():
+        return ChainValidationError('INVALID_MERKLE_ROOT', 'Merkle root does not match transactions', block.height)
+    return None
+
+def check_proof(height, header, bits, block_hash):
+    """Check a block hash against its encoded header and target, returns a failure tuple or None"""
+    if header_hash(header) != block_hash:
+        return (height, 'INVALID_BLOCK_HASH', 'Block hash does not match its header')
+    if not ProofOfWork.is_valid_proof(header, bits):
+        return (height, 'INSUFFICIENT_WORK', 'Block hash does not meet its target')
+    return None
+
+def _check_batch(headers, signatures):
+    """Check block hashes, proof of work and signatures for a run of blocks.
+
+    Runs in a worker process. headers are (height, header, bits, hash) and
+    signatures (height, tx_hash, public_key, signature, message_hash)
+    tuples. Returns the lowest (height, code, message) failure or None,
+    and the result of every signature check.
+    """
+    failures = [failure for failure in (check_proof(*header) for header in headers) if failure]
+
+    results = [
+        Wallet._verify_message_hash(public_key, signature, message_hash)
+        for _, _, public_key, signature, message_hash in signatures
+    ]
+    failures.extend(
+        (height, 'INVALID_SIGNATURE', f'Invalid signature on transaction {tx_hash}')
+        for (height, tx_hash, _, _, _), is_valid in zip(signatures, results)
+        if not is_valid
+    )
+    return min(failures, default=None), results
+
+class _Batch:
+    """Headers and uncached signatures of consecutive blocks, checked together"""
+
+    def __init__(self):
+        self.headers = []
+        self.signatures = []
+        self.future = None
+
+class ChainValidator:
+    """Validate the stored chain in one streaming pass.
+
+    Blocks are read in height order through a server-side cursor with their
+    transactions loaded a batch at a time, so memory use stays flat however
+    long the chain is. Linkage, targets and merkle roots are checked as
+    blocks are read, while block hashes, proof of work and uncached
+    signatures of earlier batches are checked in the verification process
+    pool. Validation stops at the first failure.
+    """
+
+    def __init__(self, blockchain, batch_size=None, workers=None):
+        self.blockchain = blockchain
+        self.batch_size = batch_size or DeploymentConfig.VALIDATION_BATCH_SIZE
+        self.workers = workers or DeploymentConfig.VERIFY_WORKERS
+        self.max_in_flight = self.workers * 2
+
+    def validate(self, from_height=0):
+        """Validate the blocks above from_height, which must already be valid.
+
+        Returns the HeaderInfo of the chain tip, raises ChainValidationError
+        for the lowest block that fails.
+        """
+        retarget_interval = self.blockchain.retarget_interval
+        recent = deque(maxlen=retarget_interval + 1)
+        in_flight = deque()
+        batch = _Batch()
+
+        query = Block.query.options(selectinload(Block.transactions)).filter(
+            Block.height >= max(from_height + 1 - retarget_interval, 0)
+        ).order_by(Block.height).yield_per(self.batch_size)
+
+        try:
+            for block in query:
+                info = HeaderInfo(block.height, block.hash, block.timestamp, block.bits)
+                if block.height > from_height:
+                    if not recent:
+                        raise ChainValidationError('MISSING_BLOCK', f'Block {from_height} is missing', from_height)
+                    error = self._check_block(block, recent, batch)
+                    if error:
+                        self._submit(batch, in_flight)
+                        self._drain(in_flight)
+                        raise error
+                    if len(batch.headers) >= self.batch_size:
+                        self._submit(batch, in_flight)
+                        batch = _Batch()
+                        while len(in_flight) > self.max_in_flight:
+                            self._collect(in_flight.popleft())
+                recent.append(info)
+
+            self._submit(batch, in_flight)
+            self._drain(in_flight)
+        finally:
+            for pending in in_flight:
+                pending.future.cancel()
+
+        if not recent or recent[-1].height < from_height:
+            raise ChainValidationError('MISSING_BLOCK', f'Block {from_height} is missing', from_height)
+        return recent[-1]
+
+    def _check_block(self, block, recent, batch):
+        """Checks that need the previous blocks, returns a ChainValidationError or None.
+
+        The block's header and signatures are queued on batch for the workers.
+        """
+        error = check_linkage(block, recent, self.blockchain) or check_merkle_root(block)
+        if error:
+            return error
+
+        batch.headers.append((block.height, block.header(), block.bits, block.hash))
+        for tx in block.transactions:
+            message_hash = Wallet._message_hash(tx.get_signing_data())
+            is_valid = signature_cache.get((message_hash, tx.public_key, tx.signature))
+            if is_valid is False:
+                return ChainValidationError('INVALID_SIGNATURE', f'Invalid signature on transaction {tx.hash}', block.height)
+            if is_valid is None:
+                batch.signatures.append((block.height, tx.hash, tx.public_key, tx.signature, message_hash))
+        return None
+
+    def _submit(self, batch, in_flight):
+        if not batch.headers and not batch.signatures:
+            return
+        if self.workers > 1:
+            try:
+                batch.future = _get_verify_pool().submit(_check_batch, batch.headers, batch.signatures)
+            except BrokenProcessPool:
+                _reset_verify_pool()
+        if batch.future is None:
+            batch.future = Future()
+            batch.future.set_result(_check_batch(batch.headers, batch.signatures))
+        in_flight.append(batch)
+
+    def _collect(self, batch):
+        """Wait for a batch's results, raising its lowest failure"""
+        try:
+            failure, results = batch.future.result()
+        except BrokenProcessPool:
+            _reset_verify_pool()
+            failure, results = _check_batch(batch.headers, batch.signatures)
+
+        for (_, _, public_key, signature, message_hash), is_valid in zip(batch.signatures, results):
+            signature_cache.put((message_hash, public_key, signature), is_valid)
+        if failure:
+            raise ChainValidationError(failure[1], failure[2], failure[0])
+
+    def _drain(self, in_flight):
+        """Wait for every outstanding batch in height order"""
+        while in_flight:
+            self._collect(in_flight.popleft())
@@ -1,13 +1,53 @@
+import logging
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
 from app import db
+from collections import deque
+from sqlalchemy.orm import selectinload
 from models import Block, Node, Transaction
 from datetime import datetime, timedelta
 from pbft_consensus import PBFTConsensus
+from block_producer import block_producer
+from account_state import apply_block, revert_block
+from chain_validator import HeaderInfo, check_linkage, check_merkle_root, check_proof
+from block_downloader import BlockDownloader, DownloadError
+from blockchain import chain_lock
+from wallet import Wallet
+from mempool import mempool
+from deployment_config import DeploymentConfig
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections to peers, shared by the fetch threads
+_peer_session = requests.Session()
+_peer_session.mount('http://', HTTPAdapter(pool_maxsize=DeploymentConfig.PEER_FETCH_WORKERS))
+_peer_pool = ThreadPoolExecutor(max_workers=DeploymentConfig.PEER_FETCH_WORKERS, thread_name_prefix='peer-fetch')
+
+def _fetch_json(address, path):
+    """GET a peer endpoint and parse the JSON body, raises on errors and timeouts"""
+    response = _peer_session.get(f'http://{address}{path}', timeout=DeploymentConfig.PEER_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+def _peer_tip(data):
+    """(tip height, tip hash) from a peer's /headers response, None if it is malformed"""
+    if not isinstance(data, dict):
+        return None
+    tip_height, tip_hash = data.get('tip_height'), data.get('tip_hash')
+    if not isinstance(tip_height, int) or not isinstance(tip_hash, str):
+        return None
+    return tip_height, tip_hash
+
+class SyncError(Exception):
+    """A peer's chain could not be synced"""
 
 class ConsensusManager:
     def __init__(self, blockchain):
         self.blockchain = blockchain
         self.pbft = PBFTConsensus()
+        # One sync at a time, and none while the block producer inserts a block
+        self.sync_lock = chain_lock
 
     def register_node(self, address):
         """Register a new node in the network"""
@@ -35,81 +75,252 @@ class ConsensusManager:
         if primary_changed:
             self.pbft.initiate_view_change()
 
+    def _fetch_from_peers(self, nodes, path):
+        """Fetch path from every node concurrently.
+
+        Returns {node id: parsed JSON or None}, None for peers that failed
+        or had not answered by the end of the round deadline.
+        """
+        futures = {node.id: _peer_pool.submit(_fetch_json, node.address, path) for node in nodes}
+        wait(futures.values(), timeout=DeploymentConfig.SYNC_ROUND_DEADLINE)
+
+        results = {}
+        for node in nodes:
+            future = futures[node.id]
+            if not future.done():
+                future.cancel()
+                logger.warning(f"Peer {node.address} missed the sync round deadline")
+                results[node.id] = None
+            elif future.exception():
+                logger.warning(f"Could not fetch {path} from {node.address}: {future.exception()}")
+                results[node.id] = None
+            else:
+                results[node.id] = future.result()
+        return results
+
     def resolve_conflicts(self):
-        """Resolve conflicts between nodes using both PoW and PBFT"""
+        """Sync with the peer that has the longest valid chain, using both PoW and PBFT.
+
+        Peers are asked for their tip only. The chain is then synced
+        headers-first from the best candidate, falling back to the next one
+        if that fails. Returns True if the local chain changed.
+        """
         nodes = Node.query.all()
-        new_chain = None
-        max_length = len(Block.query.all())
+        tip = Block.query.order_by(Block.height.desc()).first()
         
         # Get current primary node
         primary_node = self.pbft.get_primary_node()
         
+        # Peers are polled in parallel, the round takes as long as the slowest one
+        responses = self._fetch_from_peers(nodes, '/headers?count=0')
+        candidates = []
+        peers = {}
         for node in nodes:
-            try:
-                response = requests.get(f'http://{node.address}/chain')
-                if response.status_code == 200:
-                    length = response.json()['length']
-                    chain = response.json()['chain']
-
-                    # Give priority to primary node's chain if valid
-                    if node.id == primary_node.id and length >= max_length and self._validate_chain(chain):
-                        max_length = length
-                        new_chain = chain
-                    # Consider other nodes' chains
-                    elif length > max_length and self._validate_chain(chain):
-                        max_length = length
-                        new_chain = chain
-            except:
-                if node.id == primary_node.id:
+            is_primary = primary_node is not None and node.id == primary_node.id
+            peer_tip = _peer_tip(responses[node.id])
+            if peer_tip is None:
+                if responses[node.id] is not None:
+                    logger.warning(f"Ignoring malformed tip from {node.address}")
+                if is_primary:
                     # Initiate view change if primary node is unreachable
                     self.pbft.initiate_view_change()
                 continue
+            peer_tip_height, peer_tip_hash = peer_tip
+            # Every peer that answered can serve blocks up to its tip
+            peers[node.address] = peer_tip_height
+            if peer_tip_hash == tip.hash:
+                continue
+            # Longer chains win, the primary node's chain also wins a tie
+            if peer_tip_height > tip.height or (is_primary and peer_tip_height == tip.height):
+                candidates.append((peer_tip_height, is_primary, node))
 
-        if new_chain:
-            self._replace_chain(new_chain)
-            return True
+        for peer_tip_height, _, node in sorted(candidates, key=lambda c: (c[0], c[1]), reverse=True):
+            if self.try_sync(node.address, peer_tip_height, peers):
+                return True
         return False
 
-    def _validate_chain(self, chain):
-        """Validate chain using both PoW and PBFT"""
-        if not self.blockchain.is_valid_chain(chain):
-            return False
-            
-        # Additional PBFT validation for recent blocks
-        recent_blocks = chain[-10:]  # Validate last 10 blocks
-        for block_data in recent_blocks:
-            block = Block(
-                previous_hash=block_data['previous_hash'],
-                hash=block_data['hash'],
-                nonce=block_data['nonce']
-            )
-            if not self.pbft.validate_block(block):
+    def try_sync(self, address, peer_tip_height, peers=None):
+        """sync_with_peer, returns False and rolls back if the peer's chain could not be synced"""
+        with self.sync_lock:
+            try:
+                self.sync_with_peer(address, peer_tip_height, peers)
+                return True
+            except (SyncError, DownloadError, requests.RequestException, KeyError, TypeError, ValueError) as e:
+                db.session.rollback()
+                logger.warning(f"Could not sync with {address}: {str(e)}")
                 return False
-                
-        return True
 
-    def _replace_chain(self, new_chain):
-        """Replace the current chain with new validated chain"""
-        # Clear existing chain
-        Block.query.delete()
-        
-        # Add new blocks
-        for block_data in new_chain:
-            block = Block(
-                previous_hash=block_data['previous_hash'],
-                hash=block_data['hash'],
-                nonce=block_data['nonce']
-            )
-            
-            # Add transactions
-            for tx_data in block_data.get('transactions', []):
-                transaction = Transaction(
-                    sender=tx_data['sender'],
-                    recipient=tx_data['recipient'],
-                    amount=tx_data['amount']
-                )
-                block.transactions.append(transaction)
-                
-            db.session.add(block)
-            
+    def _peer_hash_at(self, address, height):
+        data = _fetch_json(address, f'/headers?from_height={height}&count=1')
+        headers = data['headers']
+        return headers[0]['hash'] if headers else None
+
+    def _local_hash_at(self, height):
+        return db.session.query(Block.hash).filter_by(height=height).scalar()
+
+    def find_common_ancestor(self, address, peer_tip_height):
+        """Height of the last block shared with a peer, found by binary search.
+
+        Hash linkage means both chains agree on every block up to the fork
+        point and on none after it, so O(log n) header requests are enough.
+        """
+        tip = Block.query.order_by(Block.height.desc()).first()
+        high = min(tip.height, peer_tip_height)
+
+        # Usually the peer simply extends our chain
+        if self._peer_hash_at(address, high) == self._local_hash_at(high):
+            return high
+        if self._peer_hash_at(address, 0) != self._local_hash_at(0):
+            raise SyncError('Peer has a different genesis block')
+
+        # Hashes match at low and differ at high
+        low = 0
+        while high - low > 1:
+            mid = (low + high) // 2
+            if self._peer_hash_at(address, mid) == self._local_hash_at(mid):
+                low = mid
+            else:
+                high = mid
+        return low
+
+    def _fetch_headers(self, address, ancestor, peer_tip_height):
+        """Download and check the peer's headers above ancestor, returns {height: hash}.
+
+        Linkage, targets, header hashes and proof of work are all checked
+        before any block body is requested.
+        """
+        retarget_interval = self.blockchain.retarget_interval
+        recent = deque(
+            (HeaderInfo(*row) for row in db.session.query(
+                Block.height, Block.hash, Block.timestamp, Block.bits
+            ).filter(
+                Block.height > ancestor - retarget_interval,
+                Block.height <= ancestor
+            ).order_by(Block.height)),
+            maxlen=retarget_interval + 1
+        )
+
+        hashes = {}
+        height = ancestor + 1
+        while height <= peer_tip_height:
+            data = _fetch_json(address, f'/headers?from_height={height}&count={DeploymentConfig.MAX_HEADERS_PER_REQUEST}')
+            if not data['headers']:
+                raise SyncError(f'Peer returned no headers from height {height}')
+            for header in data['headers']:
+                if height > peer_tip_height:
+                    break
+                # Every response must continue from height, so each one makes progress
+                if header['height'] != height:
+                    raise SyncError(f"Peer returned header {header['height']}, expected {height}")
+                block = Block.from_dict(header)
+                error = check_linkage(block, recent, self.blockchain)
+                failure = check_proof(block.height, block.header(), block.bits, block.hash)
+                if error or failure:
+                    raise SyncError(str(error) if error else f'Block {failure[0]}: {failure[2]}')
+                hashes[block.height] = block.hash
+                recent.append(HeaderInfo(block.height, block.hash, block.timestamp, block.bits))
+                height += 1
+        return hashes
+
+    def _fetch_blocks(self, peers, hashes, from_height, to_height):
+        """Download block bodies for checked headers from peers, yields verified unsaved blocks in height order"""
+        return iter(BlockDownloader(
+            peers, from_height, to_height, _fetch_json, _peer_pool,
+            lambda start, blocks_data: self._check_blocks(hashes, start, blocks_data),
+            invalid_errors=(SyncError, KeyError, TypeError, ValueError)
+        ))
+
+    def _check_blocks(self, hashes, start, blocks_data):
+        """Check a downloaded run of blocks against their checked headers, returns the unsaved blocks"""
+        blocks = [Block.from_dict(block_data) for block_data in blocks_data]
+        transactions = []
+        for height, block in enumerate(blocks, start):
+            if block.height != height or block.hash != hashes.get(height):
+                raise SyncError(f'Block {height} does not match its header')
+            # The body must be the one the checked header commits to
+            if block.calculate_hash() != block.hash:
+                raise SyncError(f'Block {height}: Block hash does not match its header')
+            error = check_merkle_root(block)
+            if error:
+                raise SyncError(str(error))
+            transactions.extend(block.transactions)
+
+        results = Wallet.verify_batch(
+            (tx.public_key, tx.signature, tx.get_signing_data()) for tx in transactions
+        )
+        if not all(results):
+            raise SyncError(f'Invalid transaction signature in blocks {blocks[0].height}-{blocks[-1].height}')
+        return blocks
+
+    def sync_with_peer(self, address, peer_tip_height, peers=None):
+        """Bring the local chain in line with a peer's, fetching only missing blocks.
+
+        Finds the common ancestor, checks the peer's headers above it, then
+        downloads and verifies just those block bodies, spread over the
+        peers in peers ({address: tip height}) as well. Local blocks above
+        the ancestor are rolled back and the new branch is inserted in the
+        same transaction, raises SyncError if the peer's chain is invalid.
+        Runs under sync_lock.
+        """
+        with self.sync_lock:
+            self._sync_with_peer(address, peer_tip_height, peers)
+
+    def _sync_with_peer(self, address, peer_tip_height, peers):
+        ancestor = self.find_common_ancestor(address, peer_tip_height)
+        hashes = self._fetch_headers(address, ancestor, peer_tip_height)
+        orphaned = self._rollback_to(ancestor)
+
+        sources = dict(peers or {})
+        sources[address] = peer_tip_height
+        new_blocks = []
+        for block in self._fetch_blocks(sources, hashes, ancestor + 1, peer_tip_height):
+            apply_block(block)
+            new_blocks.append(block)
+        # One flush inserts the whole branch with batched INSERTs
+        db.session.add_all(new_blocks)
+        db.session.flush()
+
+        # Additional PBFT validation for recent blocks. It needs MIN_NODES
+        # registered nodes, smaller networks rely on the checks above
+        if Node.query.count() >= self.pbft.MIN_NODES:
+            for block in new_blocks[-10:]:
+                if not self.pbft.validate_block(block):
+                    errors = '; '.join(error.message for error in self.pbft.get_validation_errors())
+                    raise SyncError(f'Block {block.height} rejected by PBFT validation: {errors}')
+
+        mined = [tx.hash for block in new_blocks for tx in block.transactions]
         db.session.commit()
+        logger.info(f"Synced blocks {ancestor + 1}-{peer_tip_height} from {address}, "
+                    f"rolled back {len(orphaned)} transactions")
+
+        # Transactions only in the abandoned branch go back to the mempool,
+        # ones the new branch already contains are rejected as mined
+        mempool.remove(mined)
+        mempool.add_many(Transaction.from_dict(tx_data) for tx_data in orphaned)
+
+        # Any block being mined now builds on a tip that no longer exists
+        block_producer.notify_new_tip()
+
+    def _rollback_to(self, height):
+        """Remove blocks above height, undoing their balance changes block by block.
+
+        Costs writes proportional to the blocks removed rather than the
+        chain. Returns the removed transactions as dicts.
+        """
+        removed = Block.query.options(selectinload(Block.transactions)).filter(
+            Block.height > height
+        ).order_by(Block.height.desc()).all()
+        if not removed:
+            return []
+
+        orphaned = []
+        for block in removed:
+            revert_block(block)
+            orphaned.extend(tx.to_dict() for tx in block.transactions)
+
+        removed_ids = [block.id for block in removed]
+        # Not left to ON DELETE CASCADE, which not every database enforces
+        Transaction.query.filter(Transaction.block_id.in_(removed_ids)).delete()
+        Block.query.filter(Block.id.in_(removed_ids)).delete()
+        self.blockchain.rewind_validated_tip(height)
+        return orphaned
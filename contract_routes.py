@@ -3,6 +3,7 @@ from app import app, db
 from models import SmartContract, ContractCall, Transaction
 from smart_contracts import SmartContractEngine
 from wallet import Wallet
+from datetime import datetime
 import json
 
 contract_engine = SmartContractEngine()
@@ -67,9 +68,11 @@ def call_contract(address):
             sender=sender,
             recipient=address,
             amount=0,  # Contract calls don't require transfer
+            timestamp=datetime.utcnow(),
             public_key=wallet.get_public_key_string()
         )
         transaction.signature = wallet.sign_transaction(transaction.get_signing_data())
+        transaction.hash = transaction.calculate_hash().hex()
 
         # Execute contract call
         result = contract_engine.call_contract(address, function_name, arguments, transaction)
@@ -0,0 +1,98 @@
+import hashlib
+from ecdsa import VerifyingKey, SECP256k1, BadSignatureError
+from ecdsa.ellipticcurve import PointJacobi
+from ecdsa.util import sigencode_string, sigdecode_string
+
+# Native libsecp256k1 bindings are optional, ecdsa is always available
+try:
+    import coincurve
+except ImportError:
+    coincurve = None
+
+# Signatures on the wire are 64-byte r || s over sha1(message_hash), which is
+# what ecdsa's SigningKey.sign/VerifyingKey.verify do with their default
+# hashfunc. Every backend must produce and accept exactly that format.
+
+CURVE_ORDER = SECP256k1.order
+
+class EcdsaBackend:
+    """Pure-Python backend using the ecdsa package"""
+
+    name = 'ecdsa'
+
+    def sign(self, private_key, message_hash):
+        """Sign with an ecdsa SigningKey, returns 64 raw signature bytes"""
+        return private_key.sign(message_hash, sigencode=sigencode_string)
+
+    def load_public_key(self, key_bytes, precompute=False):
+        """Parse a 64-byte public key, optionally with a precomputed multiplication table"""
+        if not precompute:
+            return VerifyingKey.from_string(key_bytes, curve=SECP256k1)
+        point = PointJacobi.from_bytes(
+            SECP256k1.curve,
+            key_bytes,
+            order=SECP256k1.order,
+            generator=True
+        )
+        return VerifyingKey.from_public_point(point, curve=SECP256k1)
+
+    def verify(self, public_key, signature, message_hash):
+        try:
+            return public_key.verify(signature, message_hash, sigdecode=sigdecode_string)
+        except BadSignatureError:
+            return False
+
+def _der_integer(value):
+    data = value.to_bytes((value.bit_length() + 8) // 8, 'big')
+    return b'\x02' + bytes([len(data)]) + data
+
+class CoincurveBackend:
+    """Native backend using libsecp256k1 through coincurve"""
+
+    name = 'coincurve'
+
+    @staticmethod
+    def _digest(message_hash):
+        # Same integer ecdsa derives from its sha1 digest, padded to the 32 bytes libsecp256k1 signs
+        return hashlib.sha1(message_hash).digest().rjust(32, b'\x00')
+
+    def sign(self, private_key, message_hash):
+        """Sign with an ecdsa SigningKey, returns 64 raw signature bytes"""
+        key = coincurve.PrivateKey(private_key.to_string())
+        # Recoverable signatures are r || s || recovery id, drop the id
+        return key.sign_recoverable(self._digest(message_hash), hasher=None)[:64]
+
+    def load_public_key(self, key_bytes, precompute=False):
+        """Parse a 64-byte public key, libsecp256k1 needs no per-key tables"""
+        if len(key_bytes) != 64:
+            raise ValueError("Public key must be 64 bytes")
+        return coincurve.PublicKey(b'\x04' + key_bytes)
+
+    def verify(self, public_key, signature, message_hash):
+        if len(signature) != 64:
+            return False
+        r = int.from_bytes(signature[:32], 'big')
+        s = int.from_bytes(signature[32:], 'big')
+        if not (0 < r < CURVE_ORDER and 0 < s < CURVE_ORDER):
+            return False
+        # libsecp256k1 only accepts low-s signatures, ecdsa produces either form
+        if s > CURVE_ORDER // 2:
+            s = CURVE_ORDER - s
+        body = _der_integer(r) + _der_integer(s)
+        der_signature = b'\x30' + bytes([len(body)]) + body
+        return public_key.verify(der_signature, self._digest(message_hash), hasher=None)
+
+BACKENDS = {
+    EcdsaBackend.name: EcdsaBackend,
+    CoincurveBackend.name: CoincurveBackend
+}
+
+def get_backend(name='auto'):
+    """Get a signature backend by name, 'auto' prefers the native one if installed"""
+    if name == 'auto':
+        name = CoincurveBackend.name if coincurve else EcdsaBackend.name
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown signature backend: {name}")
+    if name == CoincurveBackend.name and not coincurve:
+        raise ValueError("The coincurve signature backend is not installed")
+    return BACKENDS[name]()
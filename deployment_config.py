@@ -26,11 +26,44 @@ class DeploymentConfig:
     NODE_ROLE = os.environ.get('NODE_ROLE', 'primary')  # 'primary' or 'secondary'
     PRIMARY_NODE_ADDRESS = os.environ.get('PRIMARY_NODE', None)  # Required for secondary nodes
     NODE_NAME = os.environ.get('NODE_NAME', f'node_{PORT}')
+    NODE_ADDRESS = os.environ.get('NODE_ADDRESS', f"{os.environ.get('REPL_SLUG', 'localhost')}:{PORT}")  # host:port peers reach this node at
     
     # Consensus Configuration
     MIN_NODES = 3
     CONSENSUS_THRESHOLD = 0.67  # 67% of nodes needed for consensus
     NODE_TIMEOUT = 1800  # 30 minutes timeout for inactive nodes
+    PEER_TIMEOUT = float(os.environ.get('PEER_TIMEOUT', 5))  # seconds to connect to or hear from one peer
+    SYNC_ROUND_DEADLINE = float(os.environ.get('SYNC_ROUND_DEADLINE', 30))  # seconds before a sync round gives up on slow peers
+    PEER_FETCH_WORKERS = int(os.environ.get('PEER_FETCH_WORKERS', 16))  # peers fetched concurrently
+    MAX_HEADERS_PER_REQUEST = 2000  # headers served by one /headers request
+    MAX_BLOCKS_PER_REQUEST = 100  # full blocks served by one /blocks request
+    MAX_CHAIN_PAGE_SIZE = 500  # full blocks in one JSON page of /chain
+    BLOCK_DOWNLOAD_RETRIES = int(os.environ.get('BLOCK_DOWNLOAD_RETRIES', 3))  # times a block range is re-requested before a sync fails
+    GOSSIP_ENABLED = os.environ.get('GOSSIP_ENABLED', 'true').lower() == 'true'  # push new transactions and blocks to peers
+    GOSSIP_FANOUT = int(os.environ.get('GOSSIP_FANOUT', 8))  # peers each announcement is sent to
+    GOSSIP_SEEN_CACHE_SIZE = int(os.environ.get('GOSSIP_SEEN_CACHE_SIZE', 100000))  # announced ids remembered to drop repeats
+    GOSSIP_QUEUE_SIZE = int(os.environ.get('GOSSIP_QUEUE_SIZE', 100))  # received announcements waiting to be processed
+    MAX_GOSSIP_HEADERS = 10  # block headers accepted in one announcement
+    
+    # Mining Configuration
+    MINING_WORKERS = int(os.environ.get('MINING_WORKERS', os.cpu_count() or 1))  # processes used for nonce search
+    MINING_ENABLED = os.environ.get('MINING_ENABLED', 'true').lower() == 'true'  # run the background block producer
+    MINING_POLL_INTERVAL = 5  # seconds between checks for pending transactions
+    MAX_BLOCK_TRANSACTIONS = 500  # mempool transactions pulled into one mining job
+    INITIAL_DIFFICULTY = int(os.environ.get('INITIAL_DIFFICULTY', 4))  # leading hex zeros before the first retarget
+    TARGET_BLOCK_INTERVAL = int(os.environ.get('TARGET_BLOCK_INTERVAL', 60))  # seconds between blocks
+    RETARGET_INTERVAL = int(os.environ.get('RETARGET_INTERVAL', 10))  # blocks between difficulty adjustments
+    BALANCE_CHECKPOINT_INTERVAL = int(os.environ.get('BALANCE_CHECKPOINT_INTERVAL', 1000))  # blocks between balance snapshots
+    MEMPOOL_MAX_SIZE = int(os.environ.get('MEMPOOL_MAX_SIZE', 50000))  # pending transactions held in memory
+    MEMPOOL_MAX_AGE = int(os.environ.get('MEMPOOL_MAX_AGE', 10800))  # seconds before an unmined transaction is dropped
+    MAX_BATCH_TRANSACTIONS = int(os.environ.get('MAX_BATCH_TRANSACTIONS', 10000))  # transactions per /transactions/batch request
+    
+    # Signature Verification Configuration
+    VERIFY_WORKERS = int(os.environ.get('VERIFY_WORKERS', os.cpu_count() or 1))  # processes used for batch verification
+    SIGNATURE_CACHE_SIZE = int(os.environ.get('SIGNATURE_CACHE_SIZE', 100000))  # verified signatures kept in memory
+    PUBLIC_KEY_CACHE_SIZE = int(os.environ.get('PUBLIC_KEY_CACHE_SIZE', 10000))  # parsed public keys kept in memory
+    SIGNATURE_BACKEND = os.environ.get('SIGNATURE_BACKEND', 'auto')  # 'auto', 'coincurve' or 'ecdsa'
+    VALIDATION_BATCH_SIZE = int(os.environ.get('VALIDATION_BATCH_SIZE', 100))  # blocks read and checked per chain validation batch
     
     # Logging Configuration
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -2,6 +2,8 @@ from flask import render_template, request, jsonify, redirect, url_for
 from app import app, db
 from models import Block, Transaction, Node
 from datetime import datetime, timedelta
+from sqlalchemy import func
+from amounts import to_coins
 from consensus import ConsensusManager
 from blockchain import Blockchain
 from pbft_consensus import PBFTConsensus
@@ -14,7 +16,11 @@ pbft = PBFTConsensus()
 def explorer_dashboard():
     # Get chain statistics
     current_block_height = Block.query.count()
-    total_txns = Transaction.query.count()
+    # Count and volume of confirmed transactions in one aggregate query
+    total_txns, total_volume = db.session.query(
+        func.count(Transaction.id),
+        func.coalesce(func.sum(Transaction.amount), 0)
+    ).filter(Transaction.block_id.isnot(None)).one()
     pending_blocks = Block.query.filter_by(validation_status='pending').count()
     invalid_blocks = Block.query.filter_by(validation_status='invalid').count()
     
@@ -38,6 +44,7 @@ def explorer_dashboard():
     stats = {
         'chain_length': current_block_height,
         'total_transactions': total_txns,
+        'total_volume': to_coins(total_volume),
         'active_nodes': active_node_count,
         'total_nodes': total_nodes,
         'sync_status': sync_status,
@@ -0,0 +1,186 @@
+import logging
+import random
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from app import app, db
+from models import Block, Node, Transaction
+from mempool import mempool
+from wallet import Wallet
+from caches import LRUCache
+from chain_validator import check_proof
+from deployment_config import DeploymentConfig
+
+logger = logging.getLogger(__name__)
+
+class Gossip:
+    """Push new transactions and blocks to peers as soon as they appear.
+
+    Announcements carry only transaction hashes and block headers and go to
+    GOSSIP_FANOUT random registered peers. A peer fetches the bodies it
+    does not have from the announcer, checks them and announces them on,
+    so news spreads through the network in a few hops. Recently seen ids
+    are kept in an LRU so repeats are dropped without a lookup, and at most
+    GOSSIP_QUEUE_SIZE announcements wait to be processed.
+    """
+
+    RECEIVED = 'received'
+    ANNOUNCED = 'announced'
+
+    def __init__(self, fanout=None, seen_size=None, max_queued=None):
+        self.fanout = fanout or DeploymentConfig.GOSSIP_FANOUT
+        self.address = DeploymentConfig.NODE_ADDRESS
+        self.enabled = DeploymentConfig.GOSSIP_ENABLED
+        self.consensus = None  # set by node_manager, syncs announced blocks
+        self.max_queued = max_queued or DeploymentConfig.GOSSIP_QUEUE_SIZE
+        self._seen = LRUCache(seen_size or DeploymentConfig.GOSSIP_SEEN_CACHE_SIZE)  # (kind, id) -> RECEIVED or ANNOUNCED
+        self._queued = 0
+        self._lock = threading.Lock()
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_maxsize=DeploymentConfig.PEER_FETCH_WORKERS))
+        self._senders = ThreadPoolExecutor(max_workers=DeploymentConfig.PEER_FETCH_WORKERS, thread_name_prefix='gossip-send')
+        # Announcements are processed one at a time, the syncs they trigger
+        # also take the consensus chain lock
+        self._receiver = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gossip-receive')
+
+    def _mark(self, kind, item_ids, state):
+        for item_id in item_ids:
+            self._seen.put((kind, item_id), state)
+
+    def announce_transactions(self, tx_hashes, exclude=None):
+        """Announce transactions just added to the mempool"""
+        with self._lock:
+            tx_hashes = [
+                tx_hash for tx_hash in dict.fromkeys(tx_hashes)
+                if self._seen.get(('tx', tx_hash)) != self.ANNOUNCED
+            ]
+            self._mark('tx', tx_hashes, self.ANNOUNCED)
+        if tx_hashes:
+            self._announce({'transactions': tx_hashes}, exclude)
+
+    def announce_block(self, block, exclude=None):
+        """Announce a block just added to the chain"""
+        with self._lock:
+            if self._seen.get(('block', block.hash)) == self.ANNOUNCED:
+                return
+            self._mark('block', [block.hash], self.ANNOUNCED)
+        self._announce({'blocks': [block.header_to_dict()]}, exclude)
+
+    def _announce(self, payload, exclude):
+        if not self.enabled:
+            return
+        addresses = [
+            address for (address,) in db.session.query(Node.address)
+            if address not in (self.address, exclude)
+        ]
+        payload['sender'] = self.address
+        for address in random.sample(addresses, min(self.fanout, len(addresses))):
+            self._senders.submit(self._send, address, payload)
+
+    def _send(self, address, payload):
+        try:
+            response = self._session.post(
+                f'http://{address}/gossip/inv', json=payload, timeout=DeploymentConfig.PEER_TIMEOUT
+            )
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.debug(f"Could not announce to {address}: {str(e)}")
+
+    def receive(self, sender, tx_hashes, headers):
+        """Queue an announcement from a registered peer.
+
+        Ids are marked as seen when queued, so repeats, including ids whose
+        fetch later fails, are not fetched again. Returns the number of new
+        ids, or None if the queue is full and the announcement was dropped.
+        """
+        with self._lock:
+            tx_hashes = [
+                tx_hash for tx_hash in dict.fromkeys(tx_hashes)
+                if self._seen.get(('tx', tx_hash)) is None
+            ]
+            headers = list({
+                header['hash']: header for header in headers
+                if self._seen.get(('block', header['hash'])) is None
+            }.values())
+            if not tx_hashes and not headers:
+                return 0
+            if self._queued >= self.max_queued:
+                return None
+            self._queued += 1
+            self._mark('tx', tx_hashes, self.RECEIVED)
+            self._mark('block', [header['hash'] for header in headers], self.RECEIVED)
+        self._receiver.submit(self._process, sender, tx_hashes, headers)
+        return len(tx_hashes) + len(headers)
+
+    def _process(self, sender, tx_hashes, headers):
+        with app.app_context():
+            try:
+                if tx_hashes:
+                    self._receive_transactions(sender, tx_hashes)
+                if headers:
+                    self._receive_blocks(sender, headers)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Could not process announcement from {sender}: {str(e)}")
+            finally:
+                with self._lock:
+                    self._queued -= 1
+
+    def _receive_transactions(self, sender, tx_hashes):
+        """Fetch, verify and queue the announced transactions we do not have yet"""
+        wanted = [tx_hash for tx_hash in tx_hashes if tx_hash not in mempool]
+        mined = {
+            tx_hash for (tx_hash,) in
+            db.session.query(Transaction.hash).filter(Transaction.hash.in_(wanted))
+        } if wanted else set()
+        wanted = {tx_hash for tx_hash in wanted if tx_hash not in mined}
+        if not wanted:
+            return
+
+        response = self._session.post(
+            f'http://{sender}/gossip/getdata',
+            json={'transactions': sorted(wanted)},
+            timeout=DeploymentConfig.PEER_TIMEOUT
+        )
+        response.raise_for_status()
+        # Hashes are recomputed from the content, anything not asked for is dropped
+        transactions = [
+            tx for tx in (Transaction.from_dict(tx_data) for tx_data in response.json()['transactions'])
+            if tx.hash in wanted
+        ]
+
+        results = Wallet.verify_batch(
+            (tx.public_key, tx.signature, tx.get_signing_data()) for tx in transactions
+        )
+        valid = [tx for tx, is_valid in zip(transactions, results) if is_valid]
+        admissions = mempool.add_many(valid)
+        accepted = [tx.hash for tx, (admitted, _) in zip(valid, admissions) if admitted]
+        if not accepted:
+            return
+
+        logger.info(f"Received {len(accepted)} transactions from {sender}")
+        # Imported here as the block producer announces through this module
+        from block_producer import block_producer
+        block_producer.trigger()
+        self.announce_transactions(accepted, exclude=sender)
+
+    def _receive_blocks(self, sender, headers):
+        """Sync announced blocks that extend our chain from the announcer"""
+        for header in sorted(headers, key=lambda header: header['height']):
+            block = Block.from_dict(header)
+            if db.session.query(Block.id).filter_by(hash=block.hash).first():
+                continue
+            # Cheap to check, and keeps invalid headers from being relayed
+            if check_proof(block.height, block.header(), block.bits, block.hash):
+                logger.warning(f"Block {block.height} announced by {sender} has an invalid proof of work")
+                continue
+            # Competing blocks at our height are left to resolve_conflicts
+            tip_height = db.session.query(db.func.max(Block.height)).scalar()
+            if block.height <= tip_height or self.consensus is None:
+                continue
+
+            if self.consensus.try_sync(sender, block.height):
+                self.announce_block(block, exclude=sender)
+
+gossip = Gossip()
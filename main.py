@@ -1,9 +1,11 @@
 from app import app, db
 from deployment_config import DeploymentConfig, setup_logging
-from models import Node
+from models import Node, AccountState
+from block_producer import block_producer
+from mempool import mempool
+from account_state import rebuild_state
 from datetime import datetime
-import os
-from reset_db import create_db_if_not_exists
+from reset_db import create_db_if_not_exists, create_indexes
 
 if __name__ == "__main__":
     try:
@@ -22,22 +24,31 @@ if __name__ == "__main__":
             from explorer_routes import *
             from contract_routes import *
             from monitoring_routes import *
+            from mining_routes import *
             
-            # Create tables if they don't exist
+            # Create tables and indexes if they don't exist
             db.create_all()
+            create_indexes()
             
-            # Register current node automatically
-            host = os.environ.get('REPL_SLUG', 'localhost')
-            port = DeploymentConfig.PORT
-            current_node_address = f"{host}:{port}"
+            # Derive balances for chains stored before account_state existed
+            if not AccountState.query.first():
+                rebuild_state()
+            
+            # Pending transactions used to be stored with no block, queue them in the mempool
+            mempool.load_pending_transactions()
             
-            node = Node.query.filter_by(address=current_node_address).first()
+            # Register current node automatically
+            node = Node.query.filter_by(address=DeploymentConfig.NODE_ADDRESS).first()
             if not node:
-                node = Node(address=current_node_address)
+                node = Node(address=DeploymentConfig.NODE_ADDRESS)
                 db.session.add(node)
             node.last_seen = datetime.utcnow()
             db.session.commit()
             
+            # Mine pending transactions in the background
+            if DeploymentConfig.MINING_ENABLED:
+                block_producer.start()
+            
             # Start the server
             app.run(
                 host=DeploymentConfig.HOST,
@@ -0,0 +1,182 @@
+import threading
+import time
+from collections import OrderedDict
+from app import db
+from models import Transaction
+from wallet import Wallet
+from deployment_config import DeploymentConfig
+
+class MempoolEntry:
+    def __init__(self, transaction, tx_hash):
+        self.transaction = transaction
+        self.hash = tx_hash
+        self.added_at = time.monotonic()
+
+class Mempool:
+    """Verified transactions waiting to be mined, held in memory.
+
+    Entries are indexed by transaction hash and by sender. Block assembly
+    takes them in arrival order, so selecting k transactions is O(k).
+    There is no fee field, so the oldest transactions have priority; when
+    the pool is full new transactions are rejected rather than evicting
+    older ones, and entries older than max_age are expired.
+    """
+
+    def __init__(self, max_size=None, max_age=None):
+        self.max_size = max_size or DeploymentConfig.MEMPOOL_MAX_SIZE
+        self.max_age = max_age or DeploymentConfig.MEMPOOL_MAX_AGE
+        self._entries = OrderedDict()  # hash -> entry, in priority order
+        self._by_sender = {}  # sender -> {hash: entry}
+        self._lock = threading.RLock()
+        self.expired = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, tx_hash):
+        return tx_hash in self._entries
+
+    def add(self, transaction):
+        """Admit a verified transaction, returns (admitted, reason)"""
+        return self.add_many([transaction])[0]
+
+    def add_many(self, transactions, stored_ids=()):
+        """Admit verified transactions, returns a (admitted, reason) per item.
+
+        Transactions already in the pool or already stored are rejected as
+        duplicates, the database is checked with one query for the whole
+        batch. stored_ids are rows being moved into the pool, which are not
+        counted as duplicates of themselves.
+        """
+        transactions = list(transactions)
+        hashes = [transaction.calculate_hash().hex() for transaction in transactions]
+        stored = {}
+        if hashes:
+            query = db.session.query(Transaction.hash, Transaction.block_id).filter(
+                Transaction.hash.in_(set(hashes))
+            )
+            if stored_ids:
+                query = query.filter(Transaction.id.notin_(stored_ids))
+            stored = dict(query.all())
+
+        results = []
+        with self._lock:
+            self._expire()
+            for transaction, tx_hash in zip(transactions, hashes):
+                if tx_hash in self._entries:
+                    results.append((False, 'duplicate'))
+                elif tx_hash in stored:
+                    results.append((False, 'already mined' if stored[tx_hash] else 'duplicate'))
+                elif len(self._entries) >= self.max_size:
+                    self.rejected += 1
+                    results.append((False, 'mempool full'))
+                else:
+                    entry = MempoolEntry(_detached_copy(transaction, tx_hash), tx_hash)
+                    self._entries[tx_hash] = entry
+                    self._by_sender.setdefault(entry.transaction.sender, {})[tx_hash] = entry
+                    results.append((True, None))
+        return results
+
+    def get(self, tx_hash):
+        """Copy of a pending transaction by hash, or None"""
+        with self._lock:
+            entry = self._entries.get(tx_hash)
+            return _detached_copy(entry.transaction) if entry else None
+
+    def get_by_sender(self, sender):
+        """Copies of a sender's pending transactions in priority order"""
+        with self._lock:
+            entries = self._by_sender.get(sender, {})
+            return [_detached_copy(entry.transaction) for entry in entries.values()]
+
+    def select(self, limit):
+        """Copies of up to limit transactions in priority order for block assembly"""
+        with self._lock:
+            self._expire()
+            selected = []
+            for entry in self._entries.values():
+                if len(selected) >= limit:
+                    break
+                selected.append(_detached_copy(entry.transaction))
+            return selected
+
+    def remove(self, tx_hashes):
+        """Drop transactions, e.g. once they are mined into a block"""
+        with self._lock:
+            for tx_hash in tx_hashes:
+                entry = self._entries.pop(tx_hash, None)
+                if entry:
+                    self._drop_sender_entry(entry)
+
+    def _drop_sender_entry(self, entry):
+        sender_entries = self._by_sender.get(entry.transaction.sender)
+        if sender_entries is not None:
+            sender_entries.pop(entry.hash, None)
+            if not sender_entries:
+                del self._by_sender[entry.transaction.sender]
+
+    def _expire(self):
+        """Drop entries older than max_age, oldest entries are at the front"""
+        cutoff = time.monotonic() - self.max_age
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if entry.added_at >= cutoff:
+                break
+            self._entries.popitem(last=False)
+            self._drop_sender_entry(entry)
+            self.expired += 1
+
+    def load_pending_transactions(self):
+        """Move pending transactions stored in the database into the mempool.
+
+        Nodes used to persist submitted transactions with block_id NULL,
+        this admits them so they still get mined. Only admitted rows are
+        deleted, rejected ones stay for a later start. Returns the number
+        admitted.
+        """
+        pending = Transaction.query.filter(
+            Transaction.block_id.is_(None),
+            ~Transaction.contract_calls.any()  # contract call records, never mined
+        ).order_by(Transaction.id).all()
+        results = Wallet.verify_batch(
+            (tx.public_key, tx.signature, tx.get_signing_data()) for tx in pending
+        )
+        valid = [tx for tx, is_valid in zip(pending, results) if is_valid]
+        admissions = self.add_many(valid, stored_ids=[tx.id for tx in valid])
+        admitted = [tx for tx, (is_admitted, _) in zip(valid, admissions) if is_admitted]
+        for transaction in admitted:
+            db.session.delete(transaction)
+        db.session.commit()
+        return len(admitted)
+
+    def stats(self):
+        with self._lock:
+            self._expire()
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'max_age': self.max_age,
+                'senders': len(self._by_sender),
+                'expired': self.expired,
+                'rejected': self.rejected
+            }
+
+def _detached_copy(transaction, tx_hash=None):
+    """New unsaved Transaction with the same content.
+
+    Pending transactions are shared between request threads and the block
+    producer, so each caller gets its own object rather than one that may
+    be attached to another thread's session.
+    """
+    return Transaction(
+        sender=transaction.sender,
+        recipient=transaction.recipient,
+        amount=transaction.amount,
+        timestamp=transaction.timestamp,
+        signature=transaction.signature,
+        public_key=transaction.public_key,
+        hash=tx_hash or transaction.hash
+    )
+
+mempool = Mempool()
@@ -0,0 +1,62 @@
+import hashlib
+
+# Merkle tree over transaction hashes. Leaves are the 32-byte transaction
+# hashes; an odd node at any level is paired with itself.
+
+EMPTY_ROOT = hashlib.sha256(b'').digest()
+
+def _hash_pair(left, right):
+    return hashlib.sha256(left + right).digest()
+
+def _next_level(level):
+    if len(level) % 2:
+        level = level + [level[-1]]
+    return [_hash_pair(level[i], level[i + 1]) for i in range(0, len(level), 2)]
+
+def merkle_root(leaves):
+    """Merkle root of a list of 32-byte leaf hashes"""
+    if not leaves:
+        return EMPTY_ROOT
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0]
+
+def merkle_proof(leaves, index):
+    """Inclusion proof for leaves[index], ordered from the leaf up to the root.
+
+    Each step is a dict with the sibling hash in hex and whether the sibling
+    sits on the left or the right of the running hash.
+    """
+    if not 0 <= index < len(leaves):
+        raise IndexError("Leaf index out of range")
+
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        sibling = index ^ 1
+        proof.append({
+            'hash': level[sibling].hex(),
+            'position': 'left' if sibling < index else 'right'
+        })
+        level = _next_level(level)
+        index //= 2
+    return proof
+
+def verify_merkle_proof(leaf_hash, proof, root):
+    """Check a proof from merkle_proof; leaf_hash and root are hex strings"""
+    try:
+        current = bytes.fromhex(leaf_hash)
+        for step in proof:
+            sibling = bytes.fromhex(step['hash'])
+            if step['position'] == 'left':
+                current = _hash_pair(sibling, current)
+            elif step['position'] == 'right':
+                current = _hash_pair(current, sibling)
+            else:
+                return False
+        return current.hex() == root
+    except (KeyError, TypeError, ValueError):
+        return False
@@ -0,0 +1,40 @@
+from flask import jsonify, request
+from app import app
+from block_producer import block_producer
+from mempool import mempool
+
+@app.route('/mining/status', methods=['GET'])
+def mining_status():
+    status = block_producer.get_status()
+    status['pending_transactions'] = len(mempool)
+    return jsonify(status), 200
+
+@app.route('/mempool', methods=['GET'])
+def mempool_status():
+    """Mempool stats, with the pending transactions of ?sender= if given"""
+    response = mempool.stats()
+    sender = request.args.get('sender')
+    if sender:
+        response['transactions'] = [tx.to_dict() for tx in mempool.get_by_sender(sender)]
+    return jsonify(response), 200
+
+@app.route('/mining/jobs/<int:job_id>', methods=['GET'])
+def mining_job(job_id):
+    job = block_producer.get_job(job_id)
+    if not job:
+        return jsonify({'message': 'Mining job not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/mining/trigger', methods=['POST'])
+def trigger_mining():
+    if not block_producer.is_running():
+        return jsonify({'message': 'Block producer is not running'}), 409
+    block_producer.trigger()
+    return jsonify({'message': 'Block producer triggered'}), 202
+
+@app.route('/mining/abort', methods=['POST'])
+def abort_mining():
+    aborted = block_producer.abort('Aborted by request')
+    return jsonify({
+        'message': 'Mining job aborted' if aborted else 'No mining job in progress'
+    }), 200
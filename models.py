@@ -1,41 +1,106 @@
 from app import db
 from datetime import datetime
 import json
+from serialization import (
+    encode_transaction, transaction_hash,
+    encode_header_prefix, encode_nonce, header_hash
+)
+from merkle import merkle_root, merkle_proof
+from amounts import to_base_units, to_coins
 
 class Node(db.Model):
     __tablename__ = 'node'
     id = db.Column(db.Integer, primary_key=True)
     address = db.Column(db.String(256), unique=True, nullable=False)
-    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # stale pruning, active counts
 
 class Block(db.Model):
     __tablename__ = 'block'
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    previous_hash = db.Column(db.String(64), nullable=False)
+    height = db.Column(db.Integer, unique=True, nullable=False)  # 0 for genesis
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # latest block lookups
+    previous_hash = db.Column(db.String(64), nullable=False, index=True)  # child block lookups
     hash = db.Column(db.String(64), unique=True, nullable=False)
     nonce = db.Column(db.Integer, nullable=False)
-    validation_status = db.Column(db.String(20), default='pending')  # pending, validated, invalid
+    bits = db.Column(db.Integer, nullable=False)  # compact PoW target in force at this height
+    merkle_root = db.Column(db.String(64), nullable=False)  # root of the transaction hashes
+    validation_status = db.Column(db.String(20), default='pending', index=True)  # pending, validated, invalid
     validation_timestamp = db.Column(db.DateTime)
     validation_errors = db.Column(db.Text)  # JSON string of validation errors
     
     # Define relationships with lazy loading to prevent circular dependencies
-    transactions = db.relationship('Transaction', backref='block', lazy='select')
+    transactions = db.relationship('Transaction', backref='block', lazy='select', order_by='Transaction.id')
     contracts = db.relationship('SmartContract', backref='block', lazy='select')
 
     def to_dict(self):
         return {
             'index': self.id,
+            'height': self.height,
             'timestamp': self.timestamp.isoformat(),
             'previous_hash': self.previous_hash,
             'hash': self.hash,
             'nonce': self.nonce,
+            'bits': self.bits,
+            'merkle_root': self.merkle_root,
             'validation_status': self.validation_status,
             'validation_timestamp': self.validation_timestamp.isoformat() if self.validation_timestamp else None,
             'validation_errors': json.loads(self.validation_errors) if self.validation_errors else None,
             'transactions': [tx.to_dict() for tx in self.transactions]
         }
+
+    def header_to_dict(self):
+        """Compact header, everything needed to check linkage and proof of work"""
+        return {
+            'height': self.height,
+            'hash': self.hash,
+            'previous_hash': self.previous_hash,
+            'merkle_root': self.merkle_root,
+            'timestamp': self.timestamp.isoformat(),
+            'bits': self.bits,
+            'nonce': self.nonce
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Unsaved block from a header or full block dict received from a peer"""
+        block = cls(
+            height=data['height'],
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            previous_hash=data['previous_hash'],
+            hash=data['hash'],
+            nonce=data['nonce'],
+            bits=data['bits'],
+            merkle_root=data['merkle_root']
+        )
+        for tx_data in data.get('transactions', []):
+            block.transactions.append(Transaction.from_dict(tx_data))
+        return block
     
+    def compute_merkle_root(self, transactions=None):
+        """Merkle root of the block's transactions as hex.
+
+        Pass transactions to compute it for a block that has none attached yet.
+        """
+        if transactions is None:
+            transactions = self.transactions
+        return merkle_root([tx.calculate_hash() for tx in transactions]).hex()
+
+    def get_merkle_proof(self, transaction):
+        """Inclusion proof for one of this block's transactions"""
+        transactions = list(self.transactions)
+        return merkle_proof([tx.calculate_hash() for tx in transactions], transactions.index(transaction))
+
+    def header_prefix(self):
+        """Canonical header bytes without the nonce"""
+        return encode_header_prefix(self.height, self.previous_hash, self.merkle_root, self.timestamp, self.bits)
+
+    def header(self):
+        """Canonical fixed-size header bytes"""
+        return self.header_prefix() + encode_nonce(self.nonce)
+
+    def calculate_hash(self):
+        return header_hash(self.header())
+
     def set_validation_errors(self, errors):
         """Set validation errors as JSON string"""
         self.validation_errors = json.dumps(errors) if errors else None
@@ -49,31 +114,121 @@ class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender = db.Column(db.String(256), nullable=False)
     recipient = db.Column(db.String(256), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    block_id = db.Column(db.Integer, db.ForeignKey('block.id', ondelete='CASCADE'), nullable=True)
+    amount = db.Column(db.BigInteger, nullable=False)  # integer base units, see amounts.py
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # recent transaction lists
+    block_id = db.Column(db.Integer, db.ForeignKey('block.id', ondelete='CASCADE'), nullable=True, index=True)
     signature = db.Column(db.Text, nullable=True)
     public_key = db.Column(db.Text, nullable=True)
+    hash = db.Column(db.String(64), unique=True, nullable=False, index=True)  # content hash, the same on every node
+
+    # Per-address lookups, optionally narrowed to confirmed transactions or a block range
+    __table_args__ = (
+        db.Index('ix_transaction_sender_block_id', 'sender', 'block_id'),
+        db.Index('ix_transaction_recipient_block_id', 'recipient', 'block_id'),
+    )
     
     def to_dict(self):
         return {
+            'hash': self.hash,
             'sender': self.sender,
             'recipient': self.recipient,
-            'amount': self.amount,
+            'amount': self.coins,
             'timestamp': self.timestamp.isoformat(),
             'signature': self.signature,
             'public_key': self.public_key
         }
 
+    @classmethod
+    def from_dict(cls, data):
+        """Unsaved transaction from a dict received from a peer, its hash is recomputed"""
+        transaction = cls(
+            sender=data['sender'],
+            recipient=data['recipient'],
+            amount=to_base_units(data['amount']),
+            timestamp=datetime.fromisoformat(data['timestamp']),
+            signature=data.get('signature'),
+            public_key=data.get('public_key')
+        )
+        transaction.hash = transaction.calculate_hash().hex()
+        return transaction
+
+    @property
+    def coins(self):
+        """Amount in coins rather than base units"""
+        return to_coins(self.amount)
+
     def get_signing_data(self):
-        """Get transaction data for signing"""
+        """Get transaction data for signing, the amount is in coins as wallets sign it"""
         return {
             'sender': self.sender,
             'recipient': self.recipient,
-            'amount': self.amount,
+            'amount': self.coins,
             'timestamp': self.timestamp.isoformat()
         }
 
+    def serialize(self):
+        """Canonical binary encoding used for hashing"""
+        return encode_transaction(
+            self.sender,
+            self.recipient,
+            self.amount,
+            self.timestamp,
+            self.public_key,
+            self.signature
+        )
+
+    def calculate_hash(self):
+        """Transaction hash as 32 raw bytes, stored hex encoded in the hash column"""
+        return transaction_hash(self.serialize())
+
+class AccountState(db.Model):
+    """Confirmed balance per address, maintained as blocks are committed"""
+    __tablename__ = 'account_state'
+    address = db.Column(db.String(256), primary_key=True)
+    balance = db.Column(db.BigInteger, nullable=False, default=0)  # base units
+    updated_height = db.Column(db.Integer, nullable=False, index=True)  # height of the last block touching this account
+
+    def to_dict(self):
+        return {
+            'address': self.address,
+            'balance': to_coins(self.balance),
+            'updated_height': self.updated_height
+        }
+
+class BalanceCheckpoint(db.Model):
+    """Balance of an address as of a checkpoint height.
+
+    Checkpoints are taken every BALANCE_CHECKPOINT_INTERVAL blocks and only
+    hold the accounts that changed since the previous checkpoint.
+    """
+    __tablename__ = 'balance_checkpoint'
+    height = db.Column(db.Integer, primary_key=True)
+    address = db.Column(db.String(256), primary_key=True)
+    balance = db.Column(db.BigInteger, nullable=False)  # base units
+
+    __table_args__ = (
+        db.Index('ix_balance_checkpoint_address_height', 'address', 'height'),
+    )
+
+class ValidationCheckpoint(db.Model):
+    """Highest block whose whole chain up to it passed validation.
+
+    There is a single row, is_valid_chain only re-checks blocks above it
+    unless a full validation is requested.
+    """
+    __tablename__ = 'validation_checkpoint'
+    id = db.Column(db.Integer, primary_key=True)
+    height = db.Column(db.Integer, nullable=False)
+    hash = db.Column(db.String(64), nullable=False)
+    validated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'height': self.height,
+            'hash': self.hash,
+            'validated_at': self.validated_at.isoformat() if self.validated_at else None
+        }
+
 class SmartContract(db.Model):
     __tablename__ = 'smart_contract'
     id = db.Column(db.Integer, primary_key=True)
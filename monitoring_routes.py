@@ -2,6 +2,7 @@ from flask import jsonify, render_template
 from app import app, db
 from models import Block, Transaction, Node
 from deployment_config import get_system_stats
+from wallet import signature_cache, public_key_cache
 from datetime import datetime, timedelta
 import psutil
 
@@ -45,6 +46,14 @@ def health_check():
         'memory_usage': psutil.Process().memory_percent()
     })
 
+@app.route('/monitor/caches')
+def cache_stats():
+    """Hit/miss counters for the verification caches"""
+    return jsonify({
+        'signature_cache': signature_cache.stats(),
+        'public_key_cache': public_key_cache.stats()
+    })
+
 def _check_database():
     """Check database connectivity"""
     try:
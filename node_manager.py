@@ -1,12 +1,33 @@
-from flask import jsonify, request
+import gzip
+import json
+import zlib
+from flask import Response, jsonify, request, stream_with_context
 from app import app, db
 from models import Block, Transaction, Node
 from blockchain import Blockchain
 from consensus import ConsensusManager
+from gossip import gossip
+from mempool import mempool
+from sqlalchemy.orm import selectinload
+from deployment_config import DeploymentConfig
 
 with app.app_context():
     blockchain = Blockchain()
     consensus = ConsensusManager(blockchain)
+    gossip.consensus = consensus
+
+@app.route('/chain/validate', methods=['POST'])
+def validate_chain():
+    """Validate blocks above the validated tip, or the whole chain with ?full=true"""
+    full = request.args.get('full', 'false').lower() == 'true'
+    is_valid = blockchain.is_valid_chain(full=full)
+    checkpoint = blockchain.get_validated_tip()
+    return jsonify({
+        'valid': is_valid,
+        'full': full,
+        'error': blockchain.last_validation_error.to_dict() if blockchain.last_validation_error else None,
+        'validated_tip': checkpoint.to_dict() if checkpoint else None
+    }), 200
 
 @app.route('/nodes/register', methods=['POST'])
 def register_nodes():
@@ -28,18 +49,20 @@ def register_nodes():
 
 @app.route('/nodes/resolve', methods=['GET'])
 def consensus_route():
+    """Sync with peers and return the tip, plus the last ?limit= blocks (default 10)"""
     replaced = consensus.resolve_conflicts()
-    
-    if replaced:
-        response = {
-            'message': 'Our chain was replaced',
-            'new_chain': [b.to_dict() for b in Block.query.all()]
-        }
-    else:
-        response = {
-            'message': 'Our chain is authoritative',
-            'chain': [b.to_dict() for b in Block.query.all()]
-        }
+    limit = min(max(request.args.get('limit', 10, type=int), 0), DeploymentConfig.MAX_CHAIN_PAGE_SIZE)
+
+    tip = Block.query.order_by(Block.height.desc()).first()
+    recent = Block.query.options(selectinload(Block.transactions)).filter(
+        Block.height > tip.height - limit
+    ).order_by(Block.height).all() if limit else []
+    response = {
+        'message': 'Our chain was replaced' if replaced else 'Our chain is authoritative',
+        'length': tip.height + 1,
+        'tip': tip.header_to_dict(),
+        'new_chain' if replaced else 'chain': [b.to_dict() for b in recent]
+    }
     return jsonify(response), 200
 
 @app.route('/nodes/primary', methods=['GET'])
@@ -60,27 +83,137 @@ def request_view_change():
         'new_primary': primary.address if primary else None
     }), 200
 
+def _accepts_gzip():
+    return 'gzip' in request.headers.get('Accept-Encoding', '').lower()
+
+def _stream_chain(query, compress):
+    """Yield blocks as NDJSON lines, gzip compressed when compress is set.
+
+    The compressor is flushed after every batch of blocks so clients can
+    start parsing before the whole chain has been read.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    batch_size = DeploymentConfig.VALIDATION_BATCH_SIZE
+    lines = []
+    for block in query.yield_per(batch_size):
+        lines.append(json.dumps(block.to_dict()) + '\n')
+        if len(lines) >= batch_size:
+            chunk = ''.join(lines).encode()
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else chunk
+            lines = []
+    chunk = ''.join(lines).encode()
+    yield compressor.compress(chunk) + compressor.flush() if compressor else chunk
+
 @app.route('/chain', methods=['GET'])
 def get_chain():
-    blocks = Block.query.all()
-    chain = []
-    for block in blocks:
-        chain.append({
-            'index': block.id,
-            'timestamp': block.timestamp.isoformat(),
-            'previous_hash': block.previous_hash,
-            'hash': block.hash,
-            'nonce': block.nonce,
-            'transactions': [{
-                'sender': tx.sender,
-                'recipient': tx.recipient,
-                'amount': tx.amount
-            } for tx in block.transactions]
+    """Blocks from ?from_height=, at most ?limit= of them.
+
+    JSON pages hold up to MAX_CHAIN_PAGE_SIZE blocks and give next_height
+    for the following page. With ?format=ndjson or an application/x-ndjson
+    Accept header the blocks are streamed one per line instead, unlimited
+    unless limit is given. Responses are gzipped for clients that accept it.
+    """
+    from_height = max(request.args.get('from_height', 0, type=int), 0)
+    limit = request.args.get('limit', type=int)
+    stream = (request.args.get('format') == 'ndjson' or
+              'application/x-ndjson' in request.headers.get('Accept', ''))
+    if not stream:
+        limit = DeploymentConfig.MAX_CHAIN_PAGE_SIZE if limit is None else min(limit, DeploymentConfig.MAX_CHAIN_PAGE_SIZE)
+
+    query = Block.query.options(selectinload(Block.transactions)).filter(
+        Block.height >= from_height
+    ).order_by(Block.height)
+    if limit is not None:
+        query = query.limit(max(limit, 0))
+    compress = _accepts_gzip()
+
+    if stream:
+        response = Response(stream_with_context(_stream_chain(query, compress)), mimetype='application/x-ndjson')
+    else:
+        chain = [block.to_dict() for block in query]
+        tip_height = db.session.query(db.func.max(Block.height)).scalar()
+        next_height = chain[-1]['height'] + 1 if chain else None
+        primary = consensus.pbft.get_primary_node()
+        response = jsonify({
+            'chain': chain,
+            'length': tip_height + 1 if tip_height is not None else 0,
+            'from_height': from_height,
+            'next_height': next_height if next_height is not None and next_height <= tip_height else None,
+            'primary_node': primary.address if primary else None
         })
-    
-    primary = consensus.pbft.get_primary_node()
+        if compress:
+            response.set_data(gzip.compress(response.get_data()))
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response, 200
+
+def _height_range(limit):
+    """from_height and count query arguments, count capped at limit"""
+    from_height = max(request.args.get('from_height', 0, type=int), 0)
+    count = request.args.get('count', limit, type=int)
+    return from_height, min(max(count, 0), limit)
+
+@app.route('/headers', methods=['GET'])
+def get_headers():
+    """Compact headers of count blocks starting at from_height, with the tip for sync"""
+    from_height, count = _height_range(DeploymentConfig.MAX_HEADERS_PER_REQUEST)
+    blocks = Block.query.filter(
+        Block.height >= from_height,
+        Block.height < from_height + count
+    ).order_by(Block.height).all() if count else []
+    tip = Block.query.order_by(Block.height.desc()).first()
     return jsonify({
-        'chain': chain,
-        'length': len(chain),
-        'primary_node': primary.address if primary else None
+        'tip_height': tip.height,
+        'tip_hash': tip.hash,
+        'headers': [block.header_to_dict() for block in blocks]
     }), 200
+
+@app.route('/blocks', methods=['GET'])
+def get_blocks():
+    """Full blocks with transactions for count heights starting at from_height"""
+    from_height, count = _height_range(DeploymentConfig.MAX_BLOCKS_PER_REQUEST)
+    blocks = Block.query.options(selectinload(Block.transactions)).filter(
+        Block.height >= from_height,
+        Block.height < from_height + count
+    ).order_by(Block.height).all() if count else []
+    return jsonify({'blocks': [block.to_dict() for block in blocks]}), 200
+
+@app.route('/gossip/inv', methods=['POST'])
+def gossip_inv():
+    """Announcement of new transaction hashes and block headers from a registered peer"""
+    values = request.get_json(silent=True)
+    if not isinstance(values, dict) or not isinstance(values.get('sender'), str):
+        return jsonify({'message': 'Expected a JSON object with a sender'}), 400
+    tx_hashes = values.get('transactions', [])
+    headers = values.get('blocks', [])
+    if not isinstance(tx_hashes, list) or not isinstance(headers, list):
+        return jsonify({'message': 'transactions and blocks must be lists'}), 400
+    if len(tx_hashes) > DeploymentConfig.MAX_BATCH_TRANSACTIONS or len(headers) > DeploymentConfig.MAX_GOSSIP_HEADERS:
+        return jsonify({'message': 'Too many items in one announcement'}), 413
+    # Bodies are fetched from the sender, so only known peers are listened to
+    if not Node.query.filter_by(address=values['sender']).first():
+        return jsonify({'message': 'Unknown sender'}), 403
+
+    new = gossip.receive(
+        values['sender'],
+        [tx_hash for tx_hash in tx_hashes if isinstance(tx_hash, str)],
+        [
+            header for header in headers
+            if isinstance(header, dict) and isinstance(header.get('hash'), str)
+            and isinstance(header.get('height'), int)
+        ]
+    )
+    if new is None:
+        return jsonify({'message': 'Too many announcements waiting, try again later'}), 503
+    return jsonify({'new': new}), 202
+
+@app.route('/gossip/getdata', methods=['POST'])
+def gossip_getdata():
+    """Pending transactions by hash, for peers that received an announcement"""
+    values = request.get_json(silent=True)
+    tx_hashes = values.get('transactions') if isinstance(values, dict) else None
+    if not isinstance(tx_hashes, list):
+        return jsonify({'message': 'Expected a JSON object with a transactions list'}), 400
+    transactions = (mempool.get(tx_hash) for tx_hash in tx_hashes[:DeploymentConfig.MAX_BATCH_TRANSACTIONS])
+    return jsonify({'transactions': [tx.to_dict() for tx in transactions if tx]}), 200
@@ -2,7 +2,6 @@ from datetime import datetime
 from app import db
 from models import Node, Block, Transaction
 from enum import Enum
-import hashlib
 from wallet import Wallet
 
 class MessageType(Enum):
@@ -33,8 +32,7 @@ class PBFTConsensus:
         
     def _calculate_block_hash(self, block):
         """Calculate hash for block validation"""
-        block_string = f"{block.previous_hash}{block.transactions}{block.nonce}".encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return block.calculate_hash()
 
     def _clear_validation_errors(self):
         """Clear previous validation errors"""
@@ -85,6 +83,13 @@ class PBFTConsensus:
                 "Previous block not found in chain - possible chain split detected")
             return False
             
+        # Verify the header commits to the block's transactions
+        calculated_root = block.compute_merkle_root()
+        if calculated_root != block.merkle_root:
+            self._add_validation_error("INVALID_MERKLE_ROOT", 
+                f"Merkle root mismatch. Expected: {calculated_root}")
+            return False
+
         # Verify block hash
         calculated_hash = self._calculate_block_hash(block)
         if calculated_hash != block.hash:
@@ -93,33 +98,30 @@ class PBFTConsensus:
             return False
 
         # Verify transaction signatures
-        for tx in block.transactions:
-            if not self._verify_transaction(tx):
-                return False
-
-        return True
+        return self._verify_transactions(block.transactions)
 
-    def _verify_transaction(self, transaction):
-        """Verify a single transaction's signature"""
+    def _verify_transactions(self, transactions):
+        """Verify the signatures of a block's transactions as one batch"""
         try:
-            if not transaction.signature or not transaction.public_key:
-                self._add_validation_error("MISSING_SIGNATURE", 
-                    f"Transaction {transaction.id} is missing required signature or public key")
-                return False
-
-            if not Wallet.verify_signature(
-                transaction.public_key,
-                transaction.signature,
-                transaction.get_signing_data()
-            ):
-                self._add_validation_error("INVALID_SIGNATURE", 
-                    f"Transaction {transaction.id} has an invalid signature")
-                return False
+            for transaction in transactions:
+                if not transaction.signature or not transaction.public_key:
+                    self._add_validation_error("MISSING_SIGNATURE", 
+                        f"Transaction {transaction.id} is missing required signature or public key")
+                    return False
+
+            results = Wallet.verify_batch(
+                (tx.public_key, tx.signature, tx.get_signing_data()) for tx in transactions
+            )
+            for transaction, is_valid in zip(transactions, results):
+                if not is_valid:
+                    self._add_validation_error("INVALID_SIGNATURE", 
+                        f"Transaction {transaction.id} has an invalid signature")
+                    return False
 
             return True
         except Exception as e:
             self._add_validation_error("VERIFICATION_ERROR", 
-                f"Error verifying transaction {transaction.id}: {str(e)}")
+                f"Error verifying transactions: {str(e)}")
             return False
 
     def initiate_view_change(self):
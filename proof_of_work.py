@@ -1,18 +1,148 @@
 import hashlib
+import multiprocessing
+import os
+import queue
+from serialization import encode_nonce
+
+# Number of nonces a mining worker tries between checks of the stop flag
+NONCE_BATCH_SIZE = 10000
+
+# Largest nonce that fits the Block.nonce column
+MAX_NONCE = 2**31 - 1
+
+# Easiest target a block may use, every digest except all-ones meets it
+MAX_TARGET = (1 << 256) - 1
+
+# A retarget window may move the target by at most this factor either way
+MAX_RETARGET_FACTOR = 4
+
+def difficulty_to_target(difficulty):
+    """Convert a difficulty in leading hex zeros to an integer target.
+
+    A digest meets the target when its big-endian value is below it, which
+    for these targets is the same as having 4 * difficulty leading zero bits.
+    """
+    return min(1 << (256 - 4 * difficulty), MAX_TARGET)
+
+def target_to_bits(target):
+    """Encode a target in the compact 32-bit form stored on each block"""
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << (8 * (3 - size))
+    else:
+        mantissa = target >> (8 * (size - 3))
+    # The top mantissa bit is a sign bit in this encoding, keep it clear
+    if mantissa & 0x800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+def bits_to_target(bits):
+    """Decode a compact 32-bit target"""
+    size = bits >> 24
+    mantissa = bits & 0x7fffff
+    if size <= 3:
+        return mantissa >> (8 * (3 - size))
+    return mantissa << (8 * (size - 3))
+
+def _target_bytes(bits):
+    return min(bits_to_target(bits), MAX_TARGET).to_bytes(32, "big")
+
+def _scan_nonces(prefix_state, start, stop, step, target):
+    """Return the first nonce in range(start, stop, step) whose digest meets target"""
+    for nonce in range(start, min(stop, MAX_NONCE + 1), step):
+        guess = prefix_state.copy()
+        guess.update(encode_nonce(nonce))
+        if guess.digest() < target:
+            return nonce
+    return None
+
+def _search_nonces(header_prefix, start, step, target, stop_event, result_queue):
+    """Scan nonces start, start+step, ... until a valid one is found or stop is set"""
+    prefix_state = hashlib.sha256(header_prefix)
+    batch_span = NONCE_BATCH_SIZE * step
+    while start <= MAX_NONCE and not stop_event.is_set():
+        nonce = _scan_nonces(prefix_state, start, start + batch_span, step, target)
+        if nonce is not None:
+            result_queue.put(nonce)
+            stop_event.set()
+            return
+        start += batch_span
 
 class ProofOfWork:
-    def __init__(self, difficulty=4):
+    def __init__(self, difficulty=4, workers=None):
         self.difficulty = difficulty
-        self.target = "0" * difficulty
+        # Compact target used for the genesis block and until the first retarget
+        self.initial_bits = target_to_bits(difficulty_to_target(difficulty))
+        # Number of processes used to search the nonce space (defaults to all cores)
+        self.workers = workers or os.cpu_count() or 1
+
+    @staticmethod
+    def retarget(bits, actual_timespan, expected_timespan):
+        """Scale a target by how long the last window took compared to the goal.
+
+        Blocks that came too fast lower the target (harder), slow blocks
+        raise it. The adjustment is clamped to MAX_RETARGET_FACTOR per window.
+        """
+        actual_timespan = max(actual_timespan, expected_timespan / MAX_RETARGET_FACTOR)
+        actual_timespan = min(actual_timespan, expected_timespan * MAX_RETARGET_FACTOR)
+        target = bits_to_target(bits) * int(actual_timespan * 1000) // int(expected_timespan * 1000)
+        return target_to_bits(max(1, min(target, MAX_TARGET)))
 
-    def find_nonce(self, previous_hash, transactions):
-        nonce = 0
-        while True:
-            if self.is_valid_proof(nonce, previous_hash, transactions):
+    def find_nonce(self, header_prefix, bits, cancel_event=None):
+        """Search for a nonce meeting the bits target.
+
+        header_prefix is the encoded block header without its nonce. Returns
+        None if cancel_event is set first or the nonce space is exhausted.
+        """
+        target = _target_bytes(bits)
+        if self.workers > 1:
+            return self._find_nonce_parallel(header_prefix, target, cancel_event)
+
+        # Hash the fixed header prefix once and extend a copy of its state per nonce
+        prefix_state = hashlib.sha256(header_prefix)
+        start = 0
+        while start <= MAX_NONCE and not (cancel_event and cancel_event.is_set()):
+            nonce = _scan_nonces(prefix_state, start, start + NONCE_BATCH_SIZE, 1, target)
+            if nonce is not None:
                 return nonce
-            nonce += 1
+            start += NONCE_BATCH_SIZE
+        return None
+
+    def _find_nonce_parallel(self, header_prefix, target, cancel_event=None):
+        """Split the nonce space across worker processes, first valid nonce wins"""
+        ctx = multiprocessing.get_context()
+        stop_event = ctx.Event()
+        result_queue = ctx.Queue()
+        workers = [
+            ctx.Process(
+                target=_search_nonces,
+                args=(header_prefix, start, self.workers, target, stop_event, result_queue),
+                daemon=True
+            )
+            for start in range(self.workers)
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                try:
+                    return result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    if cancel_event and cancel_event.is_set():
+                        return None
+                    if not any(worker.is_alive() for worker in workers) and result_queue.empty():
+                        return None  # every worker ran out of nonces
+        finally:
+            # Cancel the remaining workers once a nonce is found or the search is aborted
+            stop_event.set()
+            for worker in workers:
+                worker.join(timeout=1)
+                if worker.is_alive():
+                    worker.terminate()
 
-    def is_valid_proof(self, nonce, previous_hash, transactions):
-        guess = f"{previous_hash}{transactions}{nonce}".encode()
-        guess_hash = hashlib.sha256(guess).hexdigest()
-        return guess_hash[:self.difficulty] == self.target
+    @staticmethod
+    def is_valid_proof(header, bits):
+        """Check an encoded block header against the bits target"""
+        return hashlib.sha256(header).digest() < _target_bytes(bits)
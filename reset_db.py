@@ -91,6 +91,19 @@ def create_db_if_not_exists():
         logger.error(f"Unexpected error during database setup: {e}")
         raise
 
+def create_indexes():
+    """Create any model indexes missing from existing tables.
+
+    db.create_all only creates whole tables, so indexes added to models.py
+    after a table was created have to be created separately.
+    """
+    with app.app_context():
+        import models  # Register all tables on the metadata
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=db.engine, checkfirst=True)
+        logger.info("Database indexes are up to date")
+
 def reset_database():
     """Reset and initialize the database with proper schema"""
     try:
@@ -0,0 +1,69 @@
+import hashlib
+import struct
+from datetime import datetime, timedelta
+
+# Canonical binary encodings used for hashing blocks and transactions.
+# Every node must produce identical bytes for the same data, so all
+# integers are big-endian and variable-length fields are length-prefixed.
+
+HEADER_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+# version, height, previous hash, merkle root, timestamp (us), bits
+HEADER_PREFIX_FORMAT = struct.Struct('>II32s32sqI')
+NONCE_FORMAT = struct.Struct('>I')
+HEADER_SIZE = HEADER_PREFIX_FORMAT.size + NONCE_FORMAT.size
+
+_FIELD_LENGTH = struct.Struct('>H')
+_AMOUNT = struct.Struct('>q')  # integer base units
+_TIMESTAMP = struct.Struct('>q')
+
+def timestamp_to_micros(timestamp):
+    """Convert a naive UTC datetime to integer microseconds since the epoch"""
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+def _encode_field(data):
+    if len(data) > 0xffff:
+        raise ValueError("Field too long to encode")
+    return _FIELD_LENGTH.pack(len(data)) + data
+
+def _hex_to_bytes(value):
+    """Decode an optional hex string, with or without 0x prefix"""
+    if not value:
+        return b''
+    if value.startswith('0x'):
+        value = value[2:]
+    return bytes.fromhex(value)
+
+def encode_transaction(sender, recipient, amount, timestamp, public_key, signature):
+    """Encode a transaction's signing data, key and signature, amount in integer base units"""
+    return b''.join((
+        _encode_field(sender.encode('utf-8')),
+        _encode_field(recipient.encode('utf-8')),
+        _AMOUNT.pack(amount),
+        _TIMESTAMP.pack(timestamp_to_micros(timestamp)),
+        _encode_field(_hex_to_bytes(public_key)),
+        _encode_field(_hex_to_bytes(signature))
+    ))
+
+def transaction_hash(encoded_transaction):
+    """Hash of an encoded transaction as 32 raw bytes"""
+    return hashlib.sha256(encoded_transaction).digest()
+
+def encode_header_prefix(height, previous_hash, merkle_root, timestamp, bits):
+    """Encode every header field except the nonce, which miners append"""
+    return HEADER_PREFIX_FORMAT.pack(
+        HEADER_VERSION,
+        height,
+        bytes.fromhex(previous_hash),
+        bytes.fromhex(merkle_root),
+        timestamp_to_micros(timestamp),
+        bits
+    )
+
+def encode_nonce(nonce):
+    return NONCE_FORMAT.pack(nonce)
+
+def header_hash(header):
+    """Block hash of an encoded header as a hex string"""
+    return hashlib.sha256(header).hexdigest()
@@ -0,0 +1,23 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads DATABASE_URL on import, point it at a throwaway SQLite file
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'test.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db  # noqa: E402
+import models  # noqa: E402,F401
+
+@pytest.fixture
+def app_context():
+    """Fresh tables and an empty mempool for each test"""
+    from mempool import mempool
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        mempool.remove(list(mempool._entries))
+        yield
+        db.session.remove()
@@ -0,0 +1,185 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import block_downloader
+import consensus
+from account_state import get_balance
+from app import db
+from block_downloader import BlockDownloader, DownloadError, PeerScore
+from blockchain import Blockchain
+from consensus import ConsensusManager, SyncError
+from deployment_config import DeploymentConfig
+from mempool import mempool
+from models import Block, Transaction
+from wallet import Wallet
+
+class FakePeer:
+    """Serves /headers and /blocks for a snapshot of a chain, like node_manager does"""
+
+    def __init__(self, headers, blocks):
+        self.headers = headers
+        self.blocks = blocks
+        self.requests = []
+
+    @property
+    def tip_height(self):
+        return self.headers[-1]['height']
+
+    def serve(self, path):
+        self.requests.append(path)
+        # Fail rather than hang if a sync keeps asking for the same data
+        assert len(self.requests) < 100, f'Too many requests, last {path}'
+        url = urlparse(path)
+        query = {key: int(values[0]) for key, values in parse_qs(url.query).items()}
+        start, count = query.get('from_height', 0), query.get('count', 0)
+        if url.path == '/headers':
+            return {
+                'tip_height': self.tip_height,
+                'tip_hash': self.headers[-1]['hash'],
+                'headers': self.headers_from(start, count)
+            }
+        return {'blocks': self.blocks[start:start + count]}
+
+    def headers_from(self, start, count):
+        return self.headers[start:start + count]
+
+def serve_peers(monkeypatch, peers):
+    monkeypatch.setattr(consensus, '_fetch_json', lambda address, path: peers[address].serve(path))
+
+def chain():
+    return Block.query.order_by(Block.height).all()
+
+def signed_transaction(recipient, amount):
+    wallet = Wallet()
+    wallet.generate_keys()
+    transaction = Transaction(
+        sender=wallet.get_public_key_string(),
+        recipient=recipient,
+        amount=amount,
+        timestamp=datetime.utcnow(),
+        public_key=wallet.get_public_key_string()
+    )
+    transaction.signature = wallet.sign_transaction(transaction.get_signing_data())
+    transaction.hash = transaction.calculate_hash().hex()
+    return transaction
+
+@pytest.fixture
+def forked_peer(app_context):
+    """A peer chain that shares blocks 0-3 with the local one and leads with 7 blocks.
+
+    The local chain has its own blocks 4-5, block 5 holding a transaction.
+    Returns the manager, the peer's (headers, blocks) and that transaction.
+    """
+    blockchain = Blockchain()
+    manager = ConsensusManager(blockchain)
+    for _ in range(7):
+        blockchain.create_block([])
+    peer_chain = ([block.header_to_dict() for block in chain()], [block.to_dict() for block in chain()])
+
+    manager._rollback_to(3)
+    db.session.commit()
+    blockchain.create_block([])
+    orphan = signed_transaction('local-recipient', 500)
+    blockchain.create_block([orphan])
+    return manager, peer_chain, orphan
+
+def test_reorg_across_common_ancestor(forked_peer, monkeypatch):
+    manager, peer_chain, orphan = forked_peer
+    peer = FakePeer(*peer_chain)
+    serve_peers(monkeypatch, {'peer': peer})
+    assert manager.find_common_ancestor('peer', peer.tip_height) == 3
+
+    manager.sync_with_peer('peer', peer.tip_height)
+
+    assert [block.hash for block in chain()] == [header['hash'] for header in peer.headers]
+    # The abandoned branch's transaction is pending again, its balance change undone
+    assert orphan.hash in mempool
+    assert get_balance('local-recipient') == 0
+    assert Transaction.query.filter_by(hash=orphan.hash).first() is None
+
+class SkippingPeer(FakePeer):
+    """Starts every header response one block after the one asked for"""
+
+    def headers_from(self, start, count):
+        return self.headers[start + 1:start + 1 + count] if count > 1 else super().headers_from(start, count)
+
+class GappedPeer(FakePeer):
+    """Leaves a block out of every header response"""
+
+    def headers_from(self, start, count):
+        headers = super().headers_from(start, count)
+        return headers[:1] + headers[2:] if count > 1 else headers
+
+class BeyondTipPeer(FakePeer):
+    """Answers header requests with headers above its advertised tip"""
+
+    @property
+    def tip_height(self):
+        return self.headers[-1]['height'] - 2
+
+    def headers_from(self, start, count):
+        return self.headers[-2:] if count > 1 else super().headers_from(start, count)
+
+@pytest.mark.parametrize('peer_class', [SkippingPeer, GappedPeer, BeyondTipPeer])
+def test_headers_that_do_not_continue_the_chain_fail_the_sync(forked_peer, monkeypatch, peer_class):
+    manager, peer_chain, _ = forked_peer
+    bad_peer = peer_class(*peer_chain)
+    serve_peers(monkeypatch, {'bad': bad_peer})
+    local_hashes = [block.hash for block in chain()]
+
+    assert not manager.try_sync('bad', bad_peer.tip_height)
+    assert [block.hash for block in chain()] == local_hashes
+    # The sync gave up instead of asking for the same headers again
+    header_requests = [
+        path for path in bad_peer.requests
+        if path.endswith(f'&count={DeploymentConfig.MAX_HEADERS_PER_REQUEST}')
+    ]
+    assert len(header_requests) == 1
+
+class CorruptPeer(FakePeer):
+    """Serves the right headers but block bodies that do not match them"""
+
+    def serve(self, path):
+        data = super().serve(path)
+        if path.startswith('/blocks'):
+            data = {'blocks': [dict(block, nonce=block['nonce'] + 1) for block in data['blocks']]}
+        return data
+
+def test_rejected_chunk_falls_back_to_another_peer(forked_peer, monkeypatch):
+    manager, peer_chain, _ = forked_peer
+    peer, corrupt = FakePeer(*peer_chain), CorruptPeer(*peer_chain)
+    serve_peers(monkeypatch, {'peer': peer, 'corrupt': corrupt})
+    monkeypatch.setattr(DeploymentConfig, 'MAX_BLOCKS_PER_REQUEST', 1)
+
+    manager.sync_with_peer('peer', peer.tip_height, {'corrupt': corrupt.tip_height})
+
+    assert any(path.startswith('/blocks') for path in corrupt.requests)
+    assert [block.hash for block in chain()] == [header['hash'] for header in peer.headers]
+
+def test_downloader_fails_when_every_peer_sends_invalid_chunks(monkeypatch):
+    monkeypatch.setattr(DeploymentConfig, 'MAX_BLOCKS_PER_REQUEST', 2)
+    monkeypatch.setattr(block_downloader, 'peer_scores', defaultdict(PeerScore))
+
+    def fetch(address, path):
+        query = parse_qs(urlparse(path).query)
+        start, count = int(query['from_height'][0]), int(query['count'][0])
+        return {'blocks': [{'height': height, 'peer': address} for height in range(start, start + count)]}
+
+    def validate(start, blocks_data):
+        if blocks_data[0]['peer'] != 'good':
+            raise SyncError('Block does not match its header')
+        return [block['height'] for block in blocks_data]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        downloader = BlockDownloader({'fork': 10, 'good': 10}, 1, 10, fetch, executor, validate,
+                                     invalid_errors=(SyncError,))
+        assert list(downloader) == list(range(1, 11))
+        assert 'fork' not in downloader.peers
+
+        with pytest.raises(DownloadError):
+            list(BlockDownloader({'fork': 10}, 1, 10, fetch, executor, validate,
+                                 invalid_errors=(SyncError,)))
@@ -1,9 +1,75 @@
-from ecdsa import SigningKey, VerifyingKey, SECP256k1
-from ecdsa.util import sigencode_string, sigdecode_string
+from ecdsa import SigningKey, SECP256k1
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import hashlib
 import json
 import binascii
 import os
+import threading
+from deployment_config import DeploymentConfig
+from caches import LRUCache
+from crypto_backend import get_backend
+
+# Batches smaller than this are verified in-process, the pool overhead isn't worth it
+PARALLEL_VERIFY_THRESHOLD = 64
+
+_verify_pool = None
+_verify_pool_lock = threading.Lock()
+
+# Results of past verifications keyed by (message hash, public key, signature)
+signature_cache = LRUCache(DeploymentConfig.SIGNATURE_CACHE_SIZE)
+
+# Native secp256k1 when available, pure-Python ecdsa otherwise
+signature_backend = get_backend(DeploymentConfig.SIGNATURE_BACKEND)
+
+# Parsed verifying keys keyed by public key hex
+public_key_cache = LRUCache(DeploymentConfig.PUBLIC_KEY_CACHE_SIZE)
+
+# Keys used this many times get a precomputed multiplication table
+PRECOMPUTE_THRESHOLD = 3
+
+class _CachedPublicKey:
+    def __init__(self, key_bytes):
+        self.key_bytes = key_bytes
+        self.key = signature_backend.load_public_key(key_bytes)
+        self.uses = 0
+        self.precomputed = False
+
+    def precompute(self):
+        """Swap in a key that caches multiples of its point for faster verification"""
+        self.key = signature_backend.load_public_key(self.key_bytes, precompute=True)
+        self.precomputed = True
+
+def _load_public_key(public_key_str):
+    """Get a parsed verifying key, precomputing tables for frequently seen keys"""
+    entry = public_key_cache.get(public_key_str)
+    if entry is None:
+        entry = _CachedPublicKey(binascii.unhexlify(public_key_str))
+        public_key_cache.put(public_key_str, entry)
+
+    entry.uses += 1
+    if not entry.precomputed and entry.uses >= PRECOMPUTE_THRESHOLD:
+        entry.precompute()
+    return entry.key
+
+def _get_verify_pool():
+    """Shared process pool for signature verification, created on first use"""
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is None:
+            _verify_pool = ProcessPoolExecutor(max_workers=DeploymentConfig.VERIFY_WORKERS)
+        return _verify_pool
+
+def _reset_verify_pool():
+    global _verify_pool
+    with _verify_pool_lock:
+        if _verify_pool is not None:
+            _verify_pool.shutdown(wait=False, cancel_futures=True)
+        _verify_pool = None
+
+def _verify_chunk(items):
+    """Verify a chunk of (public_key, signature, message_hash) tuples in a worker"""
+    return [Wallet._verify_message_hash(*item) for item in items]
 
 class Wallet:
     def __init__(self):
@@ -47,17 +113,31 @@ class Wallet:
         message_hash = hashlib.sha256(message).digest()
         
         # Sign the hash with the 32-byte private key
-        signature = self.private_key.sign(
-            message_hash,
-            sigencode=sigencode_string
-        )
+        signature = signature_backend.sign(self.private_key, message_hash)
         
         # Return hex-encoded signature
         return binascii.hexlify(signature).decode('ascii')
 
+    @staticmethod
+    def _message_hash(transaction_data):
+        """Hash of the canonical string representation of transaction data"""
+        message = json.dumps(transaction_data, sort_keys=True).encode()
+        return hashlib.sha256(message).digest()
+
     @staticmethod
     def verify_signature(public_key_str, signature_str, transaction_data):
         """Verify a transaction signature"""
+        message_hash = Wallet._message_hash(transaction_data)
+        cache_key = (message_hash, public_key_str, signature_str)
+        is_valid = signature_cache.get(cache_key)
+        if is_valid is None:
+            is_valid = Wallet._verify_message_hash(public_key_str, signature_str, message_hash)
+            signature_cache.put(cache_key, is_valid)
+        return is_valid
+
+    @staticmethod
+    def _verify_message_hash(public_key_str, signature_str, message_hash):
+        """Verify a signature over an already hashed message, bypassing the cache"""
         try:
             # Remove '0x' prefix if present
             if public_key_str.startswith('0x'):
@@ -65,30 +145,59 @@ class Wallet:
 
             # Convert hex signature back to bytes
             signature = binascii.unhexlify(signature_str)
-            
-            # Convert transaction data to canonical string representation
-            message = json.dumps(transaction_data, sort_keys=True).encode()
-            message_hash = hashlib.sha256(message).digest()
 
-            # Convert public key from hex to bytes (expect 64 bytes for uncompressed key)
-            public_key_bytes = binascii.unhexlify(public_key_str)
-            
-            # Create verifying key from the public key bytes
-            public_key = VerifyingKey.from_string(
-                public_key_bytes,
-                curve=SECP256k1
-            )
+            # Parse the public key from hex (expect 64 bytes for uncompressed key), reusing cached keys
+            public_key = _load_public_key(public_key_str)
 
             # Verify the signature
-            return public_key.verify(
-                signature,
-                message_hash,
-                sigdecode=sigdecode_string
-            )
+            return signature_backend.verify(public_key, signature, message_hash)
         except Exception as e:
             print(f"Signature verification failed: {str(e)}")
             return False
 
+    @staticmethod
+    def verify_batch(items):
+        """Verify many (public_key, signature, transaction_data) tuples.
+
+        Returns a list of booleans in the same order as items. Previously
+        verified signatures come from the cache, large batches of the rest
+        are split across the shared process pool.
+        """
+        results = []
+        misses = []  # (index, cache key) of items that still need verifying
+        for public_key_str, signature_str, transaction_data in items:
+            cache_key = (Wallet._message_hash(transaction_data), public_key_str, signature_str)
+            is_valid = signature_cache.get(cache_key)
+            if is_valid is None:
+                misses.append((len(results), cache_key))
+            results.append(is_valid)
+
+        pending = [(public_key_str, signature_str, message_hash)
+                   for _, (message_hash, public_key_str, signature_str) in misses]
+        for (index, cache_key), is_valid in zip(misses, Wallet._verify_uncached(pending)):
+            signature_cache.put(cache_key, is_valid)
+            results[index] = is_valid
+        return results
+
+    @staticmethod
+    def _verify_uncached(items):
+        """Verify (public_key, signature, message_hash) tuples, in parallel when worth it"""
+        workers = DeploymentConfig.VERIFY_WORKERS
+        if workers <= 1 or len(items) < PARALLEL_VERIFY_THRESHOLD:
+            return _verify_chunk(items)
+
+        # A few chunks per worker keeps the pool busy without per-item overhead
+        chunk_size = max(1, -(-len(items) // (workers * 4)))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        try:
+            results = []
+            for chunk_results in _get_verify_pool().map(_verify_chunk, chunks):
+                results.extend(chunk_results)
+            return results
+        except BrokenProcessPool:
+            _reset_verify_pool()
+            return _verify_chunk(items)
+
     def export_private_key(self):
         """Export private key in hex format (exactly 64 characters)"""
         if not self.private_key:
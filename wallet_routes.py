@@ -1,8 +1,15 @@
 from flask import jsonify, request, render_template, session, redirect, url_for
-from app import app, db
-from models import Transaction
+from app import app
+from models import Block, Transaction
 from wallet import Wallet
+from block_producer import block_producer
+from mempool import mempool
+from gossip import gossip
+from account_state import get_balance, get_balance_at
+from amounts import to_base_units, to_coins
+from deployment_config import DeploymentConfig
 from datetime import datetime
+import json
 
 # Store wallets in memory (in production, this should be properly persisted)
 wallets = {}
@@ -12,10 +19,8 @@ def index():
     wallet_address = session.get('wallet_address')
     balance = None
     if wallet_address:
-        # Calculate balance from all confirmed transactions
-        received = Transaction.query.filter_by(recipient=wallet_address).all()
-        sent = Transaction.query.filter_by(sender=wallet_address).all()
-        balance = sum(tx.amount for tx in received) - sum(tx.amount for tx in sent)
+        # Confirmed balance, maintained as blocks are committed
+        balance = to_coins(get_balance(wallet_address))
     
     return render_template('index.html', 
                          wallet_address=wallet_address,
@@ -54,16 +59,34 @@ def check_balance():
     if not wallet_address:
         return redirect(url_for('index'))
         
-    # Calculate balance from all confirmed transactions
-    received = Transaction.query.filter_by(recipient=wallet_address).all()
-    sent = Transaction.query.filter_by(sender=wallet_address).all()
-    balance = sum(tx.amount for tx in received) - sum(tx.amount for tx in sent)
+    # Confirmed balance, maintained as blocks are committed
+    balance = to_coins(get_balance(wallet_address))
     
     if request.headers.get('Content-Type') == 'application/json':
         return jsonify({'balance': balance}), 200
         
     return redirect(url_for('index'))
 
+@app.route('/wallet/balance/at', methods=['GET'])
+def balance_at_height():
+    """Balance of an address as of a given block height"""
+    wallet_address = request.args.get('address')
+    height = request.args.get('height', type=int)
+    if not wallet_address or height is None or height < 0:
+        return jsonify({'message': 'Please supply an address and a block height'}), 400
+
+    tip = Block.query.order_by(Block.height.desc()).first()
+    if height > tip.height:
+        return jsonify({'message': f'Height {height} is above the chain tip {tip.height}'}), 404
+
+    balance, checkpoint_height = get_balance_at(wallet_address, height)
+    return jsonify({
+        'address': wallet_address,
+        'height': height,
+        'balance': to_coins(balance),
+        'checkpoint_height': checkpoint_height
+    }), 200
+
 @app.route('/transaction/create', methods=['POST'])
 def create_transaction():
     # Handle form data
@@ -81,11 +104,16 @@ def create_transaction():
     if not wallet.import_private_key(values['sender_private_key']):
         return jsonify({'message': 'Invalid private key'}), 400
 
+    try:
+        amount = to_base_units(values['amount'])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
     # Create and sign transaction
     transaction = Transaction(
         sender=values['sender'],
         recipient=values['recipient'],
-        amount=float(values['amount']),
+        amount=amount,
         timestamp=datetime.utcnow(),
         public_key=wallet.get_public_key_string()
     )
@@ -93,6 +121,7 @@ def create_transaction():
     # Sign the transaction
     try:
         transaction.signature = wallet.sign_transaction(transaction.get_signing_data())
+        transaction.hash = transaction.calculate_hash().hex()
     except Exception as e:
         return jsonify({'message': f'Error signing transaction: {str(e)}'}), 400
 
@@ -104,9 +133,13 @@ def create_transaction():
     ):
         return jsonify({'message': 'Invalid transaction signature'}), 400
 
-    # Save the transaction
-    db.session.add(transaction)
-    db.session.commit()
+    # Queue the transaction for mining
+    admitted, reason = mempool.add(transaction)
+    if not admitted:
+        status = 503 if reason == 'mempool full' else 409
+        return jsonify({'message': f'Transaction rejected: {reason}'}), status
+    block_producer.trigger()
+    gossip.announce_transactions([transaction.hash])
 
     # If it's a form submission, render the response in HTML
     if request.headers.get('Content-Type') != 'application/json':
@@ -118,9 +151,34 @@ def create_transaction():
         'transaction': transaction.to_dict()
     }), 201
 
+def _find_transaction(transaction_id):
+    """Transaction by 64 hex character hash, mined or pending, or by local id"""
+    if len(transaction_id) == 64:
+        return Transaction.query.filter_by(hash=transaction_id).first() or mempool.get(transaction_id)
+    if transaction_id.isdigit():
+        return Transaction.query.get(int(transaction_id))
+    return None
+
+@app.route('/transaction/<tx_hash>', methods=['GET'])
+def get_transaction(tx_hash):
+    """Look up a transaction by hash in the chain or the mempool"""
+    transaction = Transaction.query.filter_by(hash=tx_hash).first()
+    if transaction and transaction.block:
+        return jsonify({
+            'transaction': transaction.to_dict(),
+            'status': 'confirmed',
+            'block_hash': transaction.block.hash,
+            'block_height': transaction.block.height
+        }), 200
+
+    transaction = transaction or mempool.get(tx_hash)
+    if transaction:
+        return jsonify({'transaction': transaction.to_dict(), 'status': 'pending'}), 200
+    return jsonify({'message': 'Transaction not found'}), 404
+
 @app.route('/transaction/verify/<transaction_id>', methods=['GET'])
 def verify_transaction(transaction_id):
-    transaction = Transaction.query.get(transaction_id)
+    transaction = _find_transaction(transaction_id)
     if not transaction:
         return jsonify({'message': 'Transaction not found'}), 404
 
@@ -134,3 +192,119 @@ def verify_transaction(transaction_id):
         'transaction': transaction.to_dict(),
         'is_valid': is_valid
     }), 200
+
+@app.route('/transaction/proof/<transaction_id>', methods=['GET'])
+def transaction_proof(transaction_id):
+    """Merkle inclusion proof that a transaction is in its block"""
+    transaction = _find_transaction(transaction_id)
+    if not transaction:
+        return jsonify({'message': 'Transaction not found'}), 404
+    if not transaction.block:
+        return jsonify({'message': 'Transaction is not in a block yet'}), 409
+
+    block = transaction.block
+    return jsonify({
+        'transaction_hash': transaction.hash,
+        'block_hash': block.hash,
+        'block_height': block.height,
+        'merkle_root': block.merkle_root,
+        'proof': block.get_merkle_proof(transaction)
+    }), 200
+
+BATCH_FIELDS = ['sender', 'recipient', 'amount', 'timestamp', 'public_key', 'signature']
+BATCH_STRING_FIELDS = ['sender', 'recipient', 'timestamp', 'public_key', 'signature']
+
+def _parse_signed_transaction(item):
+    """Build a Transaction from a pre-signed JSON object, raises ValueError if malformed"""
+    if not isinstance(item, dict):
+        raise ValueError('Transaction must be an object')
+    missing = [field for field in BATCH_FIELDS if field not in item]
+    if missing:
+        raise ValueError(f"Missing values: {', '.join(missing)}")
+    # The amount is checked by to_base_units below
+    not_strings = [field for field in BATCH_STRING_FIELDS if not isinstance(item[field], str) or not item[field]]
+    if not_strings:
+        raise ValueError(f"Expected non-empty strings: {', '.join(not_strings)}")
+    try:
+        transaction = Transaction(
+            sender=item['sender'],
+            recipient=item['recipient'],
+            amount=to_base_units(item['amount']),
+            timestamp=datetime.fromisoformat(item['timestamp']),
+            public_key=item['public_key'],
+            signature=item['signature']
+        )
+        transaction.hash = transaction.calculate_hash().hex()
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid transaction: {str(e)}')
+    if item.get('hash') and item['hash'] != transaction.hash:
+        raise ValueError('Transaction hash does not match its contents')
+    return transaction
+
+def _read_batch():
+    """Items of a JSON array, a {"transactions": [...]} object or NDJSON lines"""
+    if request.mimetype == 'application/x-ndjson':
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)  # reported as malformed with the item's index
+        return items
+
+    values = request.get_json(silent=True)
+    if isinstance(values, dict):
+        values = values.get('transactions')
+    if not isinstance(values, list):
+        raise ValueError('Expected a JSON array of transactions or NDJSON')
+    return values
+
+@app.route('/transactions/batch', methods=['POST'])
+def create_transactions_batch():
+    """Submit many pre-signed transactions, verified together and queued in one step"""
+    try:
+        items = _read_batch()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    if len(items) > DeploymentConfig.MAX_BATCH_TRANSACTIONS:
+        return jsonify({
+            'message': f'At most {DeploymentConfig.MAX_BATCH_TRANSACTIONS} transactions per batch'
+        }), 413
+
+    results = [None] * len(items)
+    parsed = []  # (index, transaction) of well-formed items
+    for index, item in enumerate(items):
+        try:
+            parsed.append((index, _parse_signed_transaction(item)))
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'rejected', 'error': str(e)}
+
+    signatures = Wallet.verify_batch(
+        (tx.public_key, tx.signature, tx.get_signing_data()) for _, tx in parsed
+    )
+    verified = []
+    for (index, transaction), is_valid in zip(parsed, signatures):
+        if is_valid:
+            verified.append((index, transaction))
+        else:
+            results[index] = {'index': index, 'status': 'rejected', 'error': 'Invalid transaction signature'}
+
+    admissions = mempool.add_many(tx for _, tx in verified)
+    for (index, transaction), (admitted, reason) in zip(verified, admissions):
+        if admitted:
+            results[index] = {'index': index, 'status': 'accepted', 'hash': transaction.hash}
+        else:
+            results[index] = {'index': index, 'status': 'rejected', 'error': reason}
+
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    if accepted:
+        block_producer.trigger()
+        gossip.announce_transactions(result['hash'] for result in results if result['status'] == 'accepted')
+
+    return jsonify({
+        'accepted': accepted,
+        'rejected': len(results) - accepted,
+        'results': results
+    }), 200